@@ -0,0 +1,6 @@
+'''
+Benchmarks of the flask_dynrender request pipeline on generated sites::
+
+    python -m benchmarks.run --files 1000 --depth 3 --format ini -o run.json
+    python -m benchmarks.compare before.json after.json
+'''
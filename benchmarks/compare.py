@@ -0,0 +1,33 @@
+import sys
+import json
+
+
+def compare(before, after, stat='median'):
+    '''
+    Yield ``(name, phase, before, after, ratio)`` for each timing of both
+    runs.
+    '''
+    for name in sorted(set(before['results']) & set(after['results'])):
+        for phase in ('cold', 'warm'):
+            old = before['results'][name][phase][stat]
+            new = after['results'][name][phase][stat]
+            yield name, phase, old, new, (new / old) if old else 0.0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2:
+        print('usage: python -m benchmarks.compare BEFORE.json AFTER.json')
+        return 1
+    with open(argv[0]) as f:
+        before = json.load(f)
+    with open(argv[1]) as f:
+        after = json.load(f)
+    for name, phase, old, new, ratio in compare(before, after):
+        print('%-20s %-4s %9.3fms -> %9.3fms  x%.2f' % (
+            name, phase, old, new, ratio))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
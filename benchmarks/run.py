@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+from tempfile import mkdtemp
+from .sitegen import generate_site, VALUES
+
+
+def timed(fct, repeat):
+    '''
+    Call ``fct`` ``repeat`` times, return timing statistics in milliseconds.
+    '''
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fct()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'n': repeat,
+        'min': samples[0],
+        'median': statistics.median(samples),
+        'mean': statistics.mean(samples),
+        'p95': samples[int(len(samples) * .95) - 1 if repeat > 1 else 0],
+        'max': samples[-1],
+    }
+
+
+def _handler_classes(cls):
+    yield cls
+    for sub in cls.__subclasses__():
+        yield from _handler_classes(sub)
+
+
+def clear_caches(app):
+    '''
+    Empty every process wide cache and memo so the next call runs cold.
+    '''
+    from flask_dynrender.cache import data_cache, context_cache
+    from flask_dynrender.values import value_decoder
+    from flask_dynrender.file_reader import file_reader
+    from flask_dynrender.formatting import date_formatter
+    from flask_dynrender.http_cache import template_refs_cache
+    from flask_dynrender.context_handlers import BaseContextHandler
+    data_cache.clear()
+    context_cache.clear()
+    value_decoder._memo.clear()
+    file_reader.cache.clear()
+    template_refs_cache.clear()
+    date_formatter._locales.clear()
+    date_formatter._patterns.clear()
+    BaseContextHandler._meta_key_memo.clear()
+    for cls in _handler_classes(BaseContextHandler):
+        cls._action_memo = None
+    app.jinja_env.cache.clear()
+    page_cache = getattr(app, 'page_cache', None)
+    if page_cache is not None and hasattr(page_cache, '_cache'):
+        page_cache._cache.clear()
+
+
+def cold_warm(app, fct, repeat, warmup=1):
+    '''
+    Time ``fct`` with every cache cleared before each call, then warm after
+    ``warmup`` calls (the size of the cycled targets, to prime each one).
+    '''
+    def cold():
+        clear_caches(app)
+        fct()
+    result = {'cold': timed(cold, repeat)}
+    for _ in range(warmup):
+        fct()
+    result['warm'] = timed(fct, repeat)
+    return result
+
+
+def cycle(items):
+    items = list(items)
+    state = {'i': 0}
+
+    def next_item():
+        state['i'] = (state['i'] + 1) % len(items)
+        return items[state['i']]
+    return next_item
+
+
+def run(args):
+    from flask_dynrender import create_app, get_view_class
+    from flask_dynrender.context_handlers import IniContextHandler
+    root = args.root or mkdtemp(prefix='dynrender-bench-')
+    conf_file, targets = generate_site(
+        root, files=args.files, depth=args.depth, keys=args.keys,
+        includes=args.includes, gets=args.gets, reads=args.reads,
+        fmt=args.format, seed=args.seed)
+    app = create_app(conf_file)
+    viewcls = get_view_class(app)
+    client = app.test_client()
+    rnd = random.Random(args.seed)
+    sample = rnd.sample(targets, min(len(targets), args.sample))
+    next_target = cycle(sample)
+    results = {}
+
+    def process():
+        target = next_target()
+        with app.test_request_context('/%s' % target):
+            viewcls.ctx_handler_class(target).process()
+    results['process'] = cold_warm(
+        app, process, args.repeat, len(sample))
+
+    values = [VALUES[i % len(VALUES)](rnd) for i in range(1000)]
+    handler = viewcls.ctx_handler_class('index.html')
+
+    def parse_values():
+        for value in values:
+            handler.parse_value(value)
+    results['parse_value_x1000'] = cold_warm(app, parse_values, args.repeat)
+
+    if args.format == 'ini':
+        ini = IniContextHandler('index.html')
+        paths = [
+            os.path.join(root, 'data', '%s.ini' % os.path.splitext(t)[0])
+            for t in sample]
+        next_path = cycle(paths)
+
+        def get_data():
+            with app.app_context():
+                ini.get_data(next_path())
+        results['ini_get_data'] = cold_warm(
+            app, get_data, args.repeat, len(paths))
+
+    def get_template():
+        target = next_target()
+        with app.test_request_context('/%s' % target):
+            view = viewcls()
+            view.target = target
+            view.get_template()
+    results['get_template'] = cold_warm(
+        app, get_template, args.repeat, len(sample))
+
+    def render():
+        resp = client.get('/%s' % next_target())
+        assert resp.status_code == 200, resp.status_code
+    results['render'] = cold_warm(
+        app, render, args.repeat, len(sample))
+    return {'meta': meta(args, root), 'results': results}
+
+
+def meta(args, root):
+    try:
+        commit = subprocess.check_output(
+            ('git', 'rev-parse', 'HEAD'), stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    params = vars(args).copy()
+    params.pop('output')
+    return {
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'site': root,
+        'params': params,
+    }
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the dynrender pipeline on a synthetic site.')
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--keys', type=int, default=20)
+    parser.add_argument('--includes', type=int, default=1)
+    parser.add_argument('--gets', type=int, default=1)
+    parser.add_argument('--reads', type=int, default=1)
+    parser.add_argument('--format', choices=('ini', 'json'), default='ini')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--sample', type=int, default=50,
+                        help='number of targets cycled through')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--root', help='site folder (default: temporary)')
+    parser.add_argument('-o', '--output', help='JSON result file')
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    report = run(args)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    for name, result in sorted(report['results'].items()):
+        print('%-20s cold %8.3fms  warm %8.3fms' % (
+            name, result['cold']['median'], result['warm']['median']))
+    if not args.output:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
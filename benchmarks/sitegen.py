@@ -0,0 +1,134 @@
+import os
+import json
+import random
+from os.path import join, dirname
+
+LAYOUT = '''<!doctype html>
+<html><head><title>{{META.title}}</title></head>
+<body>{% block main %}{% endblock %}</body></html>
+'''
+
+PATTERN = '''{% extends '_layout.jinja2' %}
+{% block main %}
+<h1>{{ title }}</h1>
+<ul>{% for key, value in __scope__.items() %}
+<li>{{ key }}: {{ value }}</li>{% endfor %}
+</ul>
+{% endblock %}
+'''
+
+VALUES = (
+    lambda r: str(r.randint(0, 100000)),
+    lambda r: '%s.%s' % (r.randint(0, 999), r.randint(0, 99)),
+    lambda r: r.choice(('true', 'false', 'none', 'True')),
+    lambda r: 'Date(20%02d,%s,%s)' % (
+        r.randint(0, 30), r.randint(1, 12), r.randint(10, 28)),
+    lambda r: 'Datetime(2020,%s,%s,%s,%s,%s)' % (
+        r.randint(1, 12), r.randint(10, 28), r.randint(0, 23),
+        r.randint(0, 59), r.randint(0, 59)),
+    lambda r: ' '.join(r.choice(('lorem', 'ipsum', 'dolor', 'sit', 'amet'))
+                       for _ in range(r.randint(1, 8))),
+)
+
+
+def _write(path, content):
+    os.makedirs(dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def _dump(fmt, sections):
+    '''
+    Serialize ``{section: {key: value}}``, the ``scope`` section holds the
+    top level keys.
+    '''
+    if fmt == 'json':
+        data = dict(sections.pop('scope', {}))
+        data.update(sections)
+        return json.dumps(data, indent=1)
+    return '\n'.join(
+        '[%s]\n%s\n' % (name, '\n'.join(
+            '%s = %s' % (k, v) for k, v in values.items()))
+        for name, values in sections.items())
+
+
+def _page(fmt, rnd, index, keys, includes, gets, reads, shared):
+    scope = {'title': 'page %s' % index}
+    for i in range(keys):
+        scope['key_%s' % i] = rnd.choice(VALUES)(rnd)
+    for i in range(reads):
+        scope['!read_snippet_%s' % i] = 'snippets/snippet_%s.md' % (
+            i % shared)
+    sections = {'scope': scope}
+    for i in range(includes):
+        sections['include_%s' % i] = {
+            '!include': 'shared/shared_%s' % (i % shared)}
+    for i in range(gets):
+        sections['get_%s' % i] = {
+            '!get': 'shared/shared_%s, footer, footer_%s' % (i % shared, i)}
+    if fmt == 'json':
+        for values in sections.values():
+            for key, value in values.items():
+                if key.startswith('key_'):
+                    values[key] = _json_value(value)
+    return _dump(fmt, sections)
+
+
+def _json_value(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def generate_site(
+    root, files=100, depth=3, keys=20, includes=1, gets=1, reads=1,
+    fmt='ini', shared=4, seed=0
+):
+    '''
+    Write a synthetic site under ``root`` (data, templates and configuration
+    file) and return ``(conf_file, targets)``.
+    '''
+    rnd = random.Random(seed)
+    data_dir = join(root, 'data')
+    tpl_dir = join(root, 'templates')
+    _write(join(tpl_dir, '_layout.jinja2'), LAYOUT)
+    _write(join(tpl_dir, 'index.jinja2'), PATTERN)
+    _write(join(data_dir, 'index.%s' % fmt), _dump(fmt, {
+        'scope': {'title': 'index'}}))
+    _write(join(data_dir, '_global_.%s' % fmt), _dump(fmt, {
+        'meta': {'title': 'bench'}, 'scope': {'site': 'bench'}}))
+    for i in range(shared):
+        _write(join(data_dir, 'shared', 'shared_%s.%s' % (i, fmt)), _dump(
+            fmt, {'scope': {'footer': 'footer %s' % i, 'name': 'shared'}}))
+        _write(join(data_dir, 'snippets', 'snippet_%s.md' % i),
+               '# snippet %s\n\n%s\n' % (i, 'lorem ipsum ' * 50))
+    targets = ['index.html']
+    folders = set()
+    for i in range(files):
+        folder = '/'.join(
+            'd%s_%s' % (level, (i // (level + 2)) % 4)
+            for level in range(rnd.randint(1, depth))) if depth else ''
+        if folder not in folders:
+            folders.add(folder)
+            _write(join(tpl_dir, folder, '_pattern_.jinja2'), PATTERN)
+            _write(join(data_dir, folder, '_global_.%s' % fmt), _dump(fmt, {
+                'scope': {'section': folder, '+site': ' > %s' % folder}}))
+        name = join(folder, 'page_%s' % i)
+        _write(join(data_dir, '%s.%s' % (name, fmt)), _page(
+            fmt, rnd, i, keys, includes, gets, reads, shared))
+        targets.append('%s.html' % name)
+    conf_file = join(root, 'bench.ini')
+    _write(conf_file, '\n'.join((
+        '[flask]',
+        'SECRET_KEY = bench',
+        'TEMPLATE_FOLDER = %s' % tpl_dir,
+        'STATIC_FOLDER = %s' % join(root, 'static'),
+        'DATA_FOLDER = %s' % data_dir,
+        'DATA_INDEX_POLL = 0',
+        '',
+        '[dynrender]',
+        'view_class = %s' % (
+            'IniJinjaHtmlView' if fmt == 'ini' else 'JsonJinjaHtmlView'),
+        '')))
+    return conf_file, targets
@@ -1,11 +1,27 @@
 from os import environ
 from os.path import isfile, join
 from configparser import ConfigParser
-from flask import Flask
+from flask import Flask, current_app
 from flask_assets import Environment
 from flask_mail import Mail
 from flask_wtf.recaptcha.validators import RECAPTCHA_ERROR_CODES
 from . import jinja_tools
+from .cache import data_cache, context_cache
+from .file_reader import file_reader
+from .parsers import init_parsers
+from .context_handlers.lazy import LazyJSONProvider
+from .snapshot import init_snapshot
+from .formatting import init_locale
+from .fingerprint import init_manifest
+from .compression import init_compression
+from .preload import init_preload
+from .tree_index import get_tree_index, get_trigger_mtime, \
+    check_index_trigger
+from .page_cache import init_page_cache
+from .mail_queue import init_mail_queue
+from .templates import init_templates
+from .timing import init_timing
+from .routes import init_route_table
 from .mail_handler import check_mail_conf
 from .utils import _cast_value, redirect_to_static, _get_realpath
 
@@ -40,6 +56,7 @@ def init_app(app, conf_file=None, flask_section='flask'):
         app.config.get('STATIC_FOLDER', app.static_folder))
     app.config['DATA_FOLDER'] = _get_realpath(app.config['DATA_FOLDER'])
     app.config_parser = conf_p
+    app.conf_file = conf_file
     app.conf_dynrender = {}
     app.logger.debug(
         'static_folder: %s | template_folder: %s | data_folder: %s' % (
@@ -53,7 +70,7 @@ def init_app(app, conf_file=None, flask_section='flask'):
     return True
 
 
-def init_urls(app):
+def get_view_class(app):
     from . import views
     view_tgt = app.conf_dynrender.get('VIEW_CLASS', 'JsonJinjaHtmlView')
     viewcls = [
@@ -63,8 +80,15 @@ def init_urls(app):
     ]
     if not viewcls:
         app.logger.info('Class "%s" not found' % view_tgt)
+        return None
+    return viewcls[0]
+
+
+def init_urls(app):
+    viewcls = get_view_class(app)
+    if viewcls is None:
         return False
-    viewcls = viewcls[0]
+    init_route_table(app, viewcls)
     endpnt = app.conf_dynrender.get('ENDPOINT', 'root')
     app.add_url_rule('/', view_func=viewcls.as_view('%s_emtpy' % endpnt))
     app.add_url_rule('/<path:target>', view_func=viewcls.as_view(endpnt))
@@ -74,6 +98,7 @@ def init_urls(app):
     for path in files_to_static:
         app.add_url_rule('/%s' % path, 'static.%s' % path, redirect_to_static)
         app.add_url_rule('/%s' % path, 'stattic.%s' % path, redirect_to_static)
+    init_timing(app)
 
 
 def init_assets(app):
@@ -86,6 +111,47 @@ def init_assets(app):
         assets.from_yaml(yaml_cfg)
     else:
         app.logger.debug('No yaml assets configuration file')
+    init_manifest(app)
+
+
+def init_cache(app):
+    data_cache.configure(
+        max_entries=app.config.get('DATA_CACHE_MAX_ENTRIES'),
+        max_bytes=app.config.get('DATA_CACHE_MAX_BYTES'))
+    context_cache.configure(
+        max_entries=app.config.get('CONTEXT_CACHE_MAX_ENTRIES'))
+    file_reader.configure(
+        max_entries=app.config.get('READ_CACHE_MAX_ENTRIES'),
+        max_bytes=app.config.get('READ_CACHE_MAX_BYTES'),
+        max_size=app.config.get('READ_MAX_SIZE'))
+    app.logger.debug(
+        'data cache: %(max_entries)s entries, %(max_bytes)s bytes' % (
+            data_cache.stats()))
+
+
+def _check_index_trigger():
+    check_index_trigger(current_app)
+
+
+def init_index(app):
+    roots = {app.config['DATA_FOLDER']}
+    roots.update(
+        app.config[k] for k in (
+            'JSON_DATA_DIR', 'INI_DATA_DIR', 'TOML_DATA_DIR', 'YAML_DATA_DIR')
+        if app.config.get(k))
+    for root in roots:
+        index = get_tree_index(app, root)
+        app.logger.debug('data index: %s (%s folders)' % (
+            root, index.dir_count()))
+    app.index_trigger_mtime = None
+    if app.config.get('DATA_INDEX_TRIGGER'):
+        app.index_trigger_mtime = get_trigger_mtime(
+            app.config['DATA_INDEX_TRIGGER'])
+        app.before_request(_check_index_trigger)
+    elif not float(app.config.get('DATA_INDEX_POLL', 2) or 0):
+        app.logger.warning(
+            'DATA_INDEX_POLL is 0 without DATA_INDEX_TRIGGER: new data files '
+            'and templates are only found after a restart')
 
 
 def init_contact(app):
@@ -115,21 +181,34 @@ def init_contact(app):
         for opt in app.config_parser.options('mail')
     })
     mail.init_app(app)
+    init_mail_queue(app, mail)
     return True
 
 
 def create_app(
-    conf_file=None, name=None, flask_section='flask', dynrender='dynrender'
+    conf_file=None, name=None, flask_section='flask', dynrender='dynrender',
+    preload=None
 ):
     app = Flask(name or __name__)
+    # before the jinja environment takes its ``tojson`` dumps function
+    app.json = LazyJSONProvider(app)
     if init_app(app, conf_file, flask_section):
         app.conf_dynrender.update({
             k.upper(): app.config_parser.get(dynrender, k)
             for k in app.config_parser.options(dynrender)
         })
+        init_cache(app)
+        init_parsers(app)
+        init_snapshot(app)
+        init_index(app)
+        init_page_cache(app)
         init_urls(app)
         init_assets(app)
         init_contact(app)
+        init_templates(app)
+        init_locale(app)
+        init_compression(app)
+        init_preload(app, preload)
     else:
         app.logger.error('No dynrender application can be created')
     return app
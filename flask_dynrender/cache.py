@@ -0,0 +1,188 @@
+from os import stat
+from threading import RLock
+from collections import OrderedDict
+
+
+def file_signature(path):
+    '''
+    Return a tuple identifying the current state of ``path``, or ``None`` if
+    the file does not exist.
+    '''
+    try:
+        st = stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class LRUCache(object):
+    '''
+    Thread safe LRU mapping bounded by an entry count and a byte budget.
+    A limit set to 0 disables the matching bound, ``max_entries=0`` and
+    ``max_bytes=0`` disable the cache.
+    '''
+
+    def __init__(self, max_entries=1024, max_bytes=0):
+        self._lock = RLock()
+        self._items = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    @property
+    def enabled(self):
+        return bool(self.max_entries or self.max_bytes)
+
+    def configure(self, max_entries=None, max_bytes=None):
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = int(max_entries)
+            if max_bytes is not None:
+                self.max_bytes = int(max_bytes)
+            self._evict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _ = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size=0):
+        if not self.enabled:
+            return False
+        if self.max_bytes and size > self.max_bytes:
+            return False
+        with self._lock:
+            self.pop(key)
+            self._items[key] = (value, size)
+            self.size += size
+            self._evict()
+        return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._items.pop(key)
+            except KeyError:
+                return default
+            self.size -= size
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def _evict(self):
+        while self._items and (
+            (self.max_entries and len(self._items) > self.max_entries) or
+            (self.max_bytes and self.size > self.max_bytes)
+        ):
+            _, (_, size) = self._items.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+        if not self.enabled:
+            self.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._items),
+                'bytes': self.size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / total) if total else 0.0,
+            }
+
+
+class FileCache(LRUCache):
+    '''
+    LRU cache whose entries are bound to the signature of a file, an entry is
+    only returned while the file keeps the same mtime and size.
+    '''
+
+    def get_file(self, key, path, default=None):
+        sig = file_signature(path)
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None or sig is None or entry[0][0] != sig:
+                self.misses += 1
+                if entry is not None:
+                    self.pop(key)
+                return default, sig
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0][1], sig
+
+    def set_file(self, key, sig, value, size=0):
+        if sig is None:
+            return False
+        return self.set(key, (sig, value), size)
+
+
+class DependencyCache(LRUCache):
+    '''
+    LRU cache whose entries are bound to the signatures of several files
+    (``{path: signature}``), an entry is dropped as soon as one of them
+    changes. A ``None`` signature stands for a file that must not exist.
+    '''
+
+    def get_valid(self, key, default=None):
+        entry = self._items.get(key)
+        valid = entry is not None and self.is_valid(entry[0][0])
+        with self._lock:
+            if valid and key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return entry[0][1]
+            self.misses += 1
+            if entry is not None and self._items.get(key) is entry:
+                self.pop(key)
+            return default
+
+    def get_dependencies(self, key):
+        entry = self._items.get(key)
+        return entry[0][0] if entry is not None else None
+
+    def is_valid(self, dependencies):
+        return all(
+            file_signature(path) == sig
+            for path, sig in dependencies.items())
+
+    def set_valid(self, key, dependencies, value, size=0):
+        return self.set(key, (dict(dependencies), value), size)
+
+    def add_dependencies(self, key, dependencies):
+        '''
+        Bind the entry ``key`` to more files, False when it is not cached.
+        '''
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return False
+            entry[0][0].update(dependencies)
+        return True
+
+
+# process wide cache of parsed data files, see ``BaseContextHandler.load_data``
+data_cache = FileCache(max_entries=2048, max_bytes=64 * 1024 * 1024)
+# process wide cache of processed contexts, see ``BaseView.get_context_data``
+context_cache = DependencyCache(max_entries=1024)
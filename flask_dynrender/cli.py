@@ -0,0 +1,140 @@
+import os
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+dynrender = AppGroup('dynrender', help='Flask dynrender commands.')
+
+
+@dynrender.command('freeze')
+@click.argument('out_dir', type=click.Path(file_okay=False))
+@click.option(
+    '-j', '--workers', type=int, default=None,
+    help='Number of render processes (default: cpu count).')
+@click.option(
+    '--contact', type=click.Choice(['skip', 'noform']), default='skip',
+    help='Skip the contact uris or render them without form.')
+@click.option(
+    '--slowest', type=int, default=10, help='Number of slowest targets shown.')
+def freeze_command(out_dir, workers, contact, slowest):
+    '''Render every target into OUT_DIR as static html files.'''
+    from .freeze import freeze
+    report = freeze(
+        current_app._get_current_object(), out_dir, workers, contact)
+    click.echo('%(pages)s pages in %(seconds).2fs (%(pages_per_sec).1f/s)' % (
+        report))
+    for target, status, seconds, error in report['failures']:
+        click.echo('failed: %s [%s] %s' % (target, status, error), err=True)
+    if slowest:
+        click.echo('slowest targets:')
+        for target, status, seconds, _ in report['timings'][:slowest]:
+            click.echo('  %.1fms %s' % (seconds * 1000, target))
+    if report['failures']:
+        raise SystemExit(1)
+
+
+@dynrender.command('compile')
+def compile_command():
+    '''Compile every template (into the bytecode cache if configured).'''
+    from .templates import warmup_templates
+    app = current_app._get_current_object()
+    if app.jinja_env.bytecode_cache is None:
+        click.echo('JINJA_BYTECODE_CACHE_DIR is not set, nothing is kept',
+                   err=True)
+    count, failures, seconds = warmup_templates(app)
+    click.echo('%s templates compiled in %.2fs' % (count, seconds))
+    for name, error in failures:
+        click.echo('failed: %s %s' % (name, error), err=True)
+    if failures:
+        raise SystemExit(1)
+
+
+@dynrender.command('import-sqlite')
+@click.option(
+    '--format', 'fmt', type=click.Choice(['json', 'ini']), default='json',
+    help='Format of the data files to import.')
+@click.option(
+    '--source', type=click.Path(exists=True, file_okay=False), default=None,
+    help='Data folder (default: the data folder of the format).')
+@click.argument('database', type=click.Path(dir_okay=False), required=False)
+def import_sqlite_command(fmt, source, database):
+    '''Load a JSON or INI data tree into the SqliteJinjaHtmlView DATABASE.'''
+    from .context_handlers import (
+        JsonContextHandler, IniContextHandler, SqliteContextHandler)
+    from .context_handlers.sqlite import import_tree
+    handler_cls = {
+        'json': JsonContextHandler, 'ini': IniContextHandler}[fmt]
+    source = source or handler_cls('').get_root_path()
+    database = database or SqliteContextHandler('').get_database_path()
+    count = import_tree(database, source, handler_cls)
+    click.echo('%s documents imported from %s into %s' % (
+        count, source, database))
+
+
+@dynrender.command('snapshot')
+@click.argument('out_file', type=click.Path(dir_okay=False), required=False)
+def snapshot_command(out_file):
+    '''Compile the data files into the OUT_FILE (or DATA_SNAPSHOT) snapshot.'''
+    from . import get_view_class
+    from .snapshot import build_snapshot
+    app = current_app._get_current_object()
+    out_file = out_file or app.config.get('DATA_SNAPSHOT')
+    if not out_file:
+        raise click.UsageError('OUT_FILE is required without DATA_SNAPSHOT')
+    viewcls = get_view_class(app)
+    if viewcls is None:
+        raise click.UsageError('No view class configured')
+    handler = viewcls.ctx_handler_class('')
+    root = handler.get_root_path()
+    entries, skipped = build_snapshot(out_file, root, handler)
+    click.echo('%s data files from %s compiled into %s (%s volatile '
+               'skipped)' % (entries, root, out_file, skipped))
+
+
+@dynrender.command('invalidate')
+def invalidate_command():
+    '''Make every running worker rescan its data and template indexes.'''
+    app = current_app._get_current_object()
+    trigger = app.config.get('DATA_INDEX_TRIGGER')
+    if not trigger:
+        raise click.UsageError('DATA_INDEX_TRIGGER is not set')
+    with open(trigger, 'a'):
+        pass
+    os.utime(trigger)
+    click.echo('%s touched, the indexes are rebuilt on the next request' % (
+        trigger))
+@dynrender.command('assets')
+@click.option(
+    '-j', '--workers', type=int, default=None,
+    help='Number of build threads (default: cpu count).')
+def assets_command(workers):
+    '''Build the bundles and write the hashed static files and manifest.'''
+    from . import assets
+    from .fingerprint import build_bundles, fingerprint, get_manifest_path
+    app = current_app._get_current_object()
+    count, failures = build_bundles(app, assets, workers)
+    click.echo('%s bundles built' % count)
+    for bundle, error in failures:
+        click.echo('failed: %s %s' % (bundle, error), err=True)
+    manifest_path = get_manifest_path(app)
+    manifest = fingerprint(
+        app.static_folder, os.path.relpath(manifest_path, app.static_folder),
+        workers)
+    click.echo('%s static files hashed into %s' % (
+        len(manifest), manifest_path))
+    if failures:
+        raise SystemExit(1)
+
+
+@dynrender.command('compress')
+@click.option(
+    '-j', '--workers', type=int, default=None,
+    help='Number of compression threads (default: cpu count).')
+def compress_command(workers):
+    '''Write the gzip (and brotli) copies of the static files.'''
+    from .compression import get_compressor, compress_folder
+    app = current_app._get_current_object()
+    compressor = get_compressor(app)
+    files, variants = compress_folder(compressor, app.static_folder, workers)
+    click.echo('%s static files, %s compressed copies (%s)' % (
+        files, variants, ', '.join(compressor.encodings)))
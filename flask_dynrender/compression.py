@@ -0,0 +1,218 @@
+import os
+import gzip
+import mimetypes
+from importlib import import_module
+from os.path import join, isfile, splitext, dirname
+from tempfile import mkstemp
+from concurrent.futures import ThreadPoolExecutor
+from flask import request, current_app, send_from_directory
+from werkzeug.security import safe_join
+
+# encoding -> (file suffix, factory of compress(data, level))
+ENCODINGS = {}
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/javascript', 'application/json',
+    'application/xml', 'image/svg+xml', 'application/manifest+json')
+
+
+def register_encoding(name, suffix, factory):
+    ENCODINGS[name] = (suffix, factory)
+
+
+def _gzip():
+    return lambda data, level: gzip.compress(
+        data, compresslevel=min(level, 9), mtime=0)
+
+
+def _brotli():
+    for module in ('brotli', 'brotlicffi'):
+        try:
+            brotli = import_module(module)
+        except ImportError:
+            continue
+        return lambda data, level: brotli.compress(
+            data, quality=min(level, 11))
+    raise ImportError('brotli')
+
+
+register_encoding('br', '.br', _brotli)
+register_encoding('gzip', '.gz', _gzip)
+
+
+class Compressor(object):
+    '''
+    Compress response bodies of at least ``min_size`` bytes into the
+    available ``encodings`` (in preference order) and pick the variant a
+    request accepts.
+    '''
+
+    def __init__(
+        self, encodings=('br', 'gzip'), min_size=1024, level=9,
+        dynamic_level=5
+    ):
+        self.min_size = min_size
+        self.level = level
+        self.dynamic_level = dynamic_level
+        self.encoders = {}
+        for name in encodings:
+            if name not in ENCODINGS:
+                continue
+            try:
+                self.encoders[name] = ENCODINGS[name][1]()
+            except ImportError:
+                continue
+        self.encodings = tuple(n for n in encodings if n in self.encoders)
+
+    def suffix(self, encoding):
+        return ENCODINGS[encoding][0]
+
+    def negotiate(self, available=None):
+        '''
+        Best encoding of the current request among ``available`` (default
+        all), None for identity.
+        '''
+        accepted = request.accept_encodings
+        best, best_q = None, 0
+        for name in available or self.encodings:
+            q = accepted.quality(name)
+            if q > best_q:
+                best, best_q = name, q
+        return best
+
+    def compress(self, data, encoding, level=None):
+        if len(data) < self.min_size:
+            return None
+        compressed = self.encoders[encoding](data, level or self.level)
+        return compressed if len(compressed) < len(data) else None
+
+    def variants(self, data):
+        '''
+        ``{encoding: compressed data}`` of ``data``, empty below
+        ``min_size`` or when compressing does not make it smaller.
+        '''
+        variants = {}
+        for name in self.encodings:
+            compressed = self.compress(data, name)
+            if compressed is not None:
+                variants[name] = compressed
+        return variants
+
+    def response(self, data, encoding, mimetype='text/html'):
+        resp = current_app.response_class(data, mimetype=mimetype)
+        if encoding:
+            resp.headers['Content-Encoding'] = encoding
+        resp.vary.add('Accept-Encoding')
+        return resp
+
+
+def is_variant(path):
+    '''
+    True for a precompressed copy (``app.js.gz``) of an existing file.
+    '''
+    base, ext = splitext(path)
+    return any(ext == v[0] for v in ENCODINGS.values()) and isfile(base)
+
+
+def is_compressible(path):
+    mimetype = mimetypes.guess_type(path)[0] or ''
+    return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def write_variants(compressor, path, data=None):
+    '''
+    Write the compressed copies of the file ``path`` next to it, return
+    their number.
+    '''
+    if data is None:
+        with open(path, 'rb') as f:
+            data = f.read()
+    count = 0
+    for encoding, compressed in compressor.variants(data).items():
+        # replaced atomically, the previous copy may be being served
+        fd, tmp = mkstemp(dir=dirname(path), prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(compressed)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path + compressor.suffix(encoding))
+        except OSError:
+            os.unlink(tmp)
+            raise
+        count += 1
+    return count
+
+
+def compress_folder(compressor, folder, workers=None):
+    '''
+    Precompress the compressible files of ``folder``, return ``(files,
+    variants)``.
+    '''
+    paths = []
+    for path, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        paths += (
+            join(path, f) for f in sorted(files)
+            if not f.startswith('.') and is_compressible(f) and
+            not is_variant(join(path, f)))
+    with ThreadPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        counts = list(pool.map(
+            lambda p: write_variants(compressor, p), paths))
+    return len(paths), sum(counts)
+
+
+def _static_view(app, compressor, static_view):
+    def view(filename):
+        path = safe_join(app.static_folder, filename)
+        if path is None:
+            return static_view(filename=filename)
+        encodings = [
+            name for name in compressor.encodings
+            if is_fresh(path, path + compressor.suffix(name))]
+        encoding = compressor.negotiate(encodings) if encodings else None
+        if encoding is None:
+            resp = static_view(filename=filename)
+            if is_compressible(filename):
+                resp.vary.add('Accept-Encoding')
+            return resp
+        resp = send_from_directory(
+            app.static_folder, filename + compressor.suffix(encoding),
+            mimetype=mimetypes.guess_type(filename)[0])
+        resp.headers['Content-Encoding'] = encoding
+        resp.vary.add('Accept-Encoding')
+        return resp
+    return view
+
+
+def is_fresh(path, variant):
+    try:
+        return os.stat(variant).st_mtime_ns >= os.stat(path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def get_compressor(app):
+    return Compressor(
+        encodings=[
+            e.strip() for e in str(app.config.get(
+                'COMPRESS_ENCODINGS', 'br, gzip')).split(',') if e.strip()],
+        min_size=int(app.config.get('COMPRESS_MIN_SIZE', 1024)),
+        level=int(app.config.get('COMPRESS_LEVEL', 9)),
+        dynamic_level=int(app.config.get('COMPRESS_DYNAMIC_LEVEL', 5)))
+
+
+def init_compression(app):
+    '''
+    With ``COMPRESS``, create ``app.compressor``: pages are sent compressed
+    (variants stored once in the page cache) and precompressed static files
+    (``flask dynrender compress``) are served to the clients accepting them.
+    '''
+    app.compressor = None
+    if not app.config.get('COMPRESS'):
+        return None
+    app.compressor = get_compressor(app)
+    if 'static' in app.view_functions:
+        app.view_functions['static'] = _static_view(
+            app, app.compressor, app.view_functions['static'])
+    app.logger.debug('compression: %s (min %s bytes)' % (
+        ', '.join(app.compressor.encodings), app.compressor.min_size))
+    return app.compressor
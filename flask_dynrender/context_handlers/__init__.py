@@ -1,3 +1,6 @@
 from .base import BaseContextHandler
 from .json import JsonContextHandler
-from .ini import IniContextHandler
\ No newline at end of file
+from .ini import IniContextHandler
+from .toml import TomlContextHandler
+from .yaml import YamlContextHandler
+from .sqlite import SqliteContextHandler
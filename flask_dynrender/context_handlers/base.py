@@ -1,35 +1,39 @@
+import os
 import re
-import datetime
-from os import walk
-from os.path import splitext, join, dirname, isfile, basename
-from flask import current_app
-from ..exceptions import DataHandlerNotReady
+import asyncio
+from copy import deepcopy
+from functools import partial
+from os.path import splitext, join, dirname, basename, isdir, relpath
+from flask import current_app, g, has_app_context
+from ..cache import data_cache, file_signature
+from ..exceptions import DataHandlerNotReady, FileTooLargeError, \
+    IncludeError, IncludeCycleError
+from ..file_reader import file_reader
+from ..parsers import parsers, read_bytes
+from ..tree_index import get_tree_index
+from ..timing import phase
+from ..values import value_decoder
 from ..jinja_tools import kwargs_base_target
+from .lazy import LazyValue, resolve
 
 
-date_now_re = re.compile(r'^Date\(now\)$')
-date_re = re.compile(
-    r'^Date\((?P<year>\d{4})\,(?P<month>[01]?\d)\,(?P<day>[0-3]?\d)\)$')
-datetime_now_re = re.compile(r'^Datetime\(now\)$')
-datetime_re = re.compile(
-    r'^Datetime\((?P<year>\d{4})\,(?P<month>[01]?\d)\,(?P<day>[0-3]\d)\,'
-    r'(?P<hour>[0-2]?\d)\,(?P<minute>[0-5]?\d)(\,(?P<second>[0-5]?\d))?\)$')
-
-match_set = [
-    (None, re.compile(r'^none$', re.IGNORECASE)),
-    (False, re.compile(r'^false$', re.IGNORECASE)),
-    (True, re.compile(r'^true$', re.IGNORECASE)),
-]
-match_cast = [
-    (float, re.compile(r'^\d+[\.]\d+$')),
-    (int, re.compile(r'^\d+$'))
-]
-datetime_cast = [
-    (datetime.date, date_re),
-    (datetime.date.today, date_now_re),
-    (datetime.datetime, datetime_re),
-    (datetime.datetime.now, datetime_now_re),
-]
+meta_key_re = re.compile(r'[\+\|\_\-\.\#]')
+MEMO_MAX_KEYS = 65536
+
+
+class DataPlan(object):
+    '''
+    A data file compiled once by ``BaseContextHandler.compile_plan``: each
+    top level key is classified as a plain value, an action (with its match)
+    or a value to clean, so applying it to a context does no key matching.
+    '''
+    PLAIN = 0
+    ACTION = 1
+    CLEAN = 2
+
+    def __init__(self, data, steps):
+        self.data = data
+        self.steps = steps
 
 
 class BaseContextHandler(object):
@@ -45,6 +49,17 @@ class BaseContextHandler(object):
         ('read', r'^!read_(?P<key>.+)$')
     )
     _sub_include = False
+    _include_stack = ()
+    include_max_depth = 3
+    lazy_actions = False
+    _volatile_data = False
+    _action_memo = None
+    _meta_key_memo = {}
+    data_cache = data_cache
+    value_decoder = value_decoder
+    parsers = parsers
+    parser_format = None
+    decodes_values = False
 
     def __init__(self, target, **kwargs):
         self.target = target
@@ -62,35 +77,70 @@ class BaseContextHandler(object):
             self._data['global']['target'])
         self._data['global']['kwargs'] = kwargs
         self._processed = False
+        self.dependencies = {}
+        self.volatile = False
+
+    def add_dependency(self, path, sig=False):
+        '''
+        Record a file the data depends on, ``sig`` is looked up when not
+        given (``None`` meaning the file does not exist).
+        '''
+        if sig is False:
+            sig = file_signature(path)
+        self.dependencies[path] = sig
+
+    def add_sub_handler(self, ctx_hdl):
+        self.dependencies.update(ctx_hdl.dependencies)
+        self.volatile = self.volatile or ctx_hdl.volatile
 
     def _find_files(self, fname):
+        root = self.get_root_path()
         return tuple(
-            join(folder, fname)
-            for folder, _, files in walk(self.get_root_path())
-            if fname in files)
+            join(root, path) for path in self.get_tree_index().find(fname))
+
+    def get_tree_index(self):
+        return get_tree_index(current_app, self.get_root_path())
+
+    def get_global_fname(self):
+        return '{0}.{1}'.format(self.global_name, self.extension)
+
+    def find_global_files(self):
+        '''
+        Global files from the data root down to the target folder, in merge
+        order.
+        '''
+        global_fname = self.get_global_fname()
+        index = self.get_tree_index()
+        root = self.get_root_path()
+        target_dirs = ['']
+        target_dirs += (n for n in dirname(self.target).split('/') if n)
+        dir_name = ''
+        g_files = []
+        for folder in target_dirs:
+            dir_name = join(dir_name, folder)
+            if index.has_file(join(dir_name, global_fname)):
+                g_files.append(join(root, dir_name, global_fname))
+            else:
+                self.add_dependency(join(root, dir_name, global_fname), None)
+        return g_files
 
     def is_meta_key(self, key):
-        return re.sub(r'[\+\|\_\-\.\#]', '', key).startswith('meta')
+        memo = self._meta_key_memo
+        try:
+            return memo[key]
+        except KeyError:
+            pass
+        if len(memo) > MEMO_MAX_KEYS:
+            memo.clear()
+        value = memo[key] = meta_key_re.sub('', key).startswith('meta')
+        return value
 
     def parse_value(self, value):
         if not isinstance(value, str):
             return value
-        strip_v = value.strip()
-        for v, reg in match_set:
-            if reg.match(strip_v) is not None:
-                return v
-        for _cls, reg in match_cast:
-            if reg.match(strip_v) is not None:
-                return _cls(strip_v)
-        for _cls, reg in datetime_cast:
-            match = reg.match(strip_v)
-            if match:
-                gpdict = match.groupdict()
-                if gpdict:
-                    return _cls(
-                        **{k: int(v) for k, v in gpdict.items()})
-                else:
-                    return _cls()
+        value, volatile = self.value_decoder.decode(value)
+        if volatile:
+            self._volatile_data = True
         return value
 
     def meta_parse(self, data):
@@ -103,12 +153,33 @@ class BaseContextHandler(object):
                     meta[key.replace('meta_', '')] = data[key]
         return meta
 
+    def _get_action_memo(self):
+        cls = type(self)
+        memo = cls.__dict__.get('_action_memo')
+        if memo is None or memo[0] is not cls.actions:
+            memo = (
+                cls.actions,
+                tuple((name, re.compile(reg)) for name, reg in cls.actions),
+                {})
+            cls._action_memo = memo
+        return memo
+
     def find_action(self, key):
-        for action_name, reg in self.actions:
-            match = re.search(reg, key)
+        _, actions, memo = self._get_action_memo()
+        try:
+            return memo[key]
+        except KeyError:
+            pass
+        found = None, None
+        for action_name, reg in actions:
+            match = reg.search(key)
             if match:
-                return action_name, match
-        return None, None
+                found = action_name, match
+                break
+        if len(memo) > MEMO_MAX_KEYS:
+            memo.clear()
+        memo[key] = found
+        return found
 
     def get_root_path(self):
         return current_app.config.get(
@@ -120,8 +191,179 @@ class BaseContextHandler(object):
     def get_scope_path(self):
         return join(self.get_root_path(), self.get_scope_fname())
 
+    def get_source_file(self, target):
+        '''
+        File whose signature validates the data of ``target``.
+        '''
+        return target
+
+    def list_scopes(self, folder):
+        '''
+        Names (without extension) of the scope files of ``folder``.
+        '''
+        ext = '.%s' % self.extension
+        data_dir = join(self.get_root_path(), folder)
+        if not isdir(data_dir):
+            return []
+        return sorted(
+            splitext(fname)[0] for fname in os.listdir(data_dir)
+            if fname.endswith(ext) and fname != self.get_global_fname())
+
     def get_data(self, target):
-        raise NotImplementedError()
+        '''
+        Decode ``target`` with the active backend of ``parser_format``.
+        '''
+        if self.parser_format is None:
+            raise NotImplementedError()
+        return self.parsers.loads(self.parser_format, read_bytes(target))
+
+    def load_data(self, target):
+        '''
+        Cached ``get_data``: parsed files are kept in the process wide
+        ``data_cache`` as long as their mtime and size don't change.
+        '''
+        return deepcopy(self.load_plan(target).data)
+
+    def load_plan(self, target):
+        '''
+        Return the ``DataPlan`` of ``target`` from ``data_cache``, parsing
+        and compiling the file when it changed. Plans of the data snapshot
+        are compiled once per request and not kept in ``data_cache``.
+        '''
+        key = (type(self).__name__, target)
+        prefetched = get_prefetched_plans().get(key)
+        if prefetched is not None:
+            plan, source, sig, volatile = prefetched
+            self.add_dependency(source, sig)
+            self.volatile = self.volatile or volatile
+            return plan
+        cache = self.data_cache
+        source = self.get_source_file(target)
+        if cache.enabled:
+            plan, sig = cache.get_file(key, source)
+        else:
+            plan, sig = None, file_signature(source)
+        self.add_dependency(source, sig)
+        if plan is not None:
+            return plan
+        data = self.load_snapshot_data(target, sig)
+        if data is not None:
+            # kept for the request only, the data stays in the shared
+            # snapshot pages instead of a copy per process
+            plan = self.compile_plan(data)
+            get_prefetched_plans()[key] = (plan, source, sig, False)
+            return plan
+        self._volatile_data = False
+        plan = self.compile_plan(self.get_data(target))
+        if self._volatile_data:
+            self.volatile = True
+        elif cache.enabled:
+            cache.set_file(key, sig, plan, sig[1] if sig else 0)
+        return plan
+
+    def get_snapshot(self):
+        return getattr(current_app, 'data_snapshot', None)
+
+    def load_snapshot_data(self, target, sig):
+        '''
+        ``get_data`` output of ``target`` from the compiled data snapshot,
+        None if there is no snapshot or it's outdated for this file.
+        '''
+        snapshot = self.get_snapshot()
+        if snapshot is None or sig is None:
+            return None
+        return snapshot.get(
+            type(self).__name__, relpath(target, self.get_root_path()), sig)
+
+    def iter_include_targets(self, data):
+        '''
+        Targets named by the ``!include`` and ``!get`` actions of ``data``.
+        '''
+        for key, val in data.items():
+            if isinstance(val, dict):
+                yield from self.iter_include_targets(val)
+            elif isinstance(val, list):
+                for v in val:
+                    if isinstance(v, dict):
+                        yield from self.iter_include_targets(v)
+            elif isinstance(val, str):
+                action = self.find_action(key)[0]
+                if action == 'include':
+                    yield val
+                elif action == 'get':
+                    yield val.split(',')[0].strip()
+
+    def _load_plan_copy(self, app, target):
+        # a handler per thread, its dependencies are handed to load_plan
+        with app.app_context():
+            loader = type(self)(self.target)
+            plan = loader.load_plan(target)
+            source = loader.get_source_file(target)
+            return target, (
+                plan, source, loader.dependencies.get(source),
+                loader.volatile)
+
+    async def prefetch(self, executor=None):
+        '''
+        Load the plans of the global files, of the scope and (without lazy
+        actions) of the included targets concurrently on ``executor``,
+        ``process`` then applies them in its usual order without any file
+        access. Return the number of plans loaded.
+        '''
+        loop = asyncio.get_running_loop()
+        app = current_app._get_current_object()
+        plans = get_prefetched_plans()
+        name = type(self).__name__
+        max_depth = current_app.config.get(
+            'INCLUDE_MAX_DEPTH', self.include_max_depth)
+        lazy = self.use_lazy_actions()
+        targets = list(self.find_global_files()) + [self.get_scope_path()]
+        depth = count = 0
+        while targets:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(executor, self._load_plan_copy, app, t)
+                for t in targets), return_exceptions=True)
+            targets = []
+            for result in results:
+                if isinstance(result, Exception):
+                    # raised again (or logged) by process
+                    continue
+                target, entry = result
+                plans[(name, target)] = entry
+                count += 1
+                if lazy or depth > max_depth:
+                    continue
+                for inc_tgt in self.iter_include_targets(entry[0].data):
+                    path = type(self)(inc_tgt).get_scope_path()
+                    if (name, path) not in plans and path not in targets:
+                        targets.append(path)
+            depth += 1
+        return count
+
+    def _needs_clean(self, val):
+        if isinstance(val, dict):
+            return any(
+                self._needs_clean(v) if isinstance(v, dict)
+                else self.find_action(k)[0] is not None
+                for k, v in val.items())
+        if isinstance(val, (list, tuple)):
+            return any(
+                not isinstance(v, dict) or self._needs_clean(v) for v in val)
+        return False
+
+    def compile_plan(self, data):
+        steps = []
+        for key, val in data.items():
+            if isinstance(val, str):
+                action, match = self.find_action(key)
+                if action:
+                    steps.append((DataPlan.ACTION, key, val, action, match))
+                    continue
+            elif key not in ('meta', 'global') and self._needs_clean(val):
+                steps.append((DataPlan.CLEAN, key, val))
+                continue
+            steps.append((DataPlan.PLAIN, key, val))
+        return DataPlan(data, tuple(steps))
 
     def get_action(self, data_tgt, action_name, key, value, match):
         fct_name = 'get_action_%s' % action_name.lower()
@@ -130,15 +372,22 @@ class BaseContextHandler(object):
             return action_handler(data_tgt, key, value, match)
         return key, value
 
+    def use_lazy_actions(self):
+        '''
+        ``!include``, ``!get`` and ``!read_`` values are loaded when a
+        template uses them instead of during ``process``.
+        '''
+        return current_app.config.get('LAZY_ACTIONS', self.lazy_actions)
+
     def get_action_append(self, data_tgt, key, value, match):
         n_key = key[1:]
         if n_key not in self._data[data_tgt]:
             return n_key, value
         if isinstance(value, dict):
-            data = self._data[data_tgt][n_key].copy()
+            data = resolve(self._data[data_tgt][n_key]).copy()
             data.update(value)
             return n_key, data
-        data = self._data[data_tgt][n_key]
+        data = resolve(self._data[data_tgt][n_key])
         data += value
         return n_key, data
 
@@ -148,32 +397,51 @@ class BaseContextHandler(object):
         if n_key not in self._data[data_tgt]:
             return n_key, value
         if isinstance(value, dict):
-            value.update(self._data[data_tgt][n_key].copy())
+            value.update(resolve(self._data[data_tgt][n_key]).copy())
             return n_key, value
-        return n_key, value + self._data[data_tgt][n_key]
-
-    def get_action_include(self, data_tgt, key, inc_tgt, match):
-        if self._sub_include:
-            return False
-        ctx_hdl = type(self)(inc_tgt)
-        ctx_hdl._sub_include = True
-        ctx_hdl.process_scope()
-        return 'include', ctx_hdl._data['scope']
-
-    def get_action_get(self, data_tgt, key, get_args, match):
-        if self._sub_include:
-            return False
-        d_val = get_args
-        get_args = get_args.split(',')
-        inc_tgt = get_args[0].strip()
-        get_name = get_args[1].strip()
-        n_key = get_args[2] if len(get_args) > 2 else get_args[1]
-        ctx_hdl = type(self)(inc_tgt)
+        return n_key, value + resolve(self._data[data_tgt][n_key])
+
+    def get_include_stack(self):
+        '''
+        Targets (without extension) from the rendered one down to this
+        handler.
+        '''
+        return self._include_stack or (splitext(self.target)[0],)
+
+    @classmethod
+    def load_include(cls, inc_tgt, stack=()):
+        '''
+        Handler of the included ``inc_tgt`` with its scope processed, once
+        per request, ``stack`` being the targets including it.
+        '''
+        name = splitext(inc_tgt)[0]
+        if name in stack:
+            raise IncludeCycleError('include cycle: %s' % ' -> '.join(
+                stack + (name,)))
+        max_depth = current_app.config.get(
+            'INCLUDE_MAX_DEPTH', cls.include_max_depth)
+        if len(stack) > max_depth:
+            raise IncludeError('include depth %s exceeded: %s' % (
+                max_depth, ' -> '.join(stack + (name,))))
+        registry = get_include_registry()
+        key = (cls.__name__, name)
+        ctx_hdl = registry.get(key)
+        if ctx_hdl is not None:
+            return ctx_hdl
+        ctx_hdl = cls(inc_tgt)
         ctx_hdl._sub_include = True
+        ctx_hdl._include_stack = stack + (name,)
         ctx_hdl.process_scope()
         ctx_hdl._processed = True
-        scope = ctx_hdl.get_scope()
-
+        registry[key] = ctx_hdl
+        return ctx_hdl
+
+    @staticmethod
+    def get_included_value(scope, inc_tgt, get_name):
+        '''
+        Value named ``get_name`` (``name``, ``name:index`` or ``name.key``) of
+        an included scope, raise a LookupError when it is missing.
+        '''
         if ':' in get_name:
             i = int(get_name.split(':')[1])
             get_name = get_name.split(':')[0]
@@ -183,7 +451,7 @@ class BaseContextHandler(object):
                 current_app.logger.warning(
                     'fail to action get in target : %s key : %s:%s' % (
                         inc_tgt, get_name, i))
-                return key, d_val
+                raise
         elif '.' in get_name:
             k = int(get_name.split('.')[1])
             get_name = get_name.split('.')[0]
@@ -193,19 +461,50 @@ class BaseContextHandler(object):
                 current_app.logger.warning(
                     'fail to action get in target : %s key : %s.%s' % (
                         inc_tgt, get_name, k))
-                return key, d_val
+                raise
         value = scope.get(get_name)
-        return n_key, value
+        return value
+
+    def get_action_include(self, data_tgt, key, inc_tgt, match):
+        if self.use_lazy_actions():
+            self.add_dependency(self.get_source_file(
+                type(self)(inc_tgt).get_scope_path()))
+            return 'include', LazyValue(partial(
+                _lazy_include, type(self), inc_tgt, self.get_include_stack()))
+        ctx_hdl = self.load_include(inc_tgt, self.get_include_stack())
+        self.add_sub_handler(ctx_hdl)
+        # the included handler is shared by every includer of the request
+        return 'include', deepcopy(ctx_hdl.get_scope())
+
+    def get_action_get(self, data_tgt, key, get_args, match):
+        d_val = get_args
+        get_args = get_args.split(',')
+        inc_tgt = get_args[0].strip()
+        get_name = get_args[1].strip()
+        n_key = get_args[2] if len(get_args) > 2 else get_args[1]
+        if self.use_lazy_actions():
+            self.add_dependency(self.get_source_file(
+                type(self)(inc_tgt).get_scope_path()))
+            return n_key, LazyValue(partial(
+                _lazy_get, type(self), inc_tgt, get_name, d_val,
+                self.get_include_stack()))
+        ctx_hdl = self.load_include(inc_tgt, self.get_include_stack())
+        self.add_sub_handler(ctx_hdl)
+        try:
+            value = self.get_included_value(
+                ctx_hdl.get_scope(), inc_tgt, get_name)
+        except (IndexError, KeyError):
+            return key, d_val
+        return n_key, deepcopy(value)
 
     def get_action_read(self, data_tgt, rkey, fname, match):
         key = match.groupdict()['key']
         self._data[data_tgt][key] = fname
         file_path = join(self.get_root_path(), fname)
-        if isfile(file_path):
-            value = open(file_path, 'r').read()
-        else:
-            value = 'no such file: %s' % file_path
-        return key, value
+        self.add_dependency(file_path)
+        if self.use_lazy_actions():
+            return key, LazyValue(partial(read_data_file, file_path))
+        return key, read_data_file(file_path)
 
     def update(self, tgt, data):
         if tgt not in self._data:
@@ -219,6 +518,23 @@ class BaseContextHandler(object):
                 key, val = self.clean_val(tgt, key, val)
             self._data[tgt][key] = val
 
+    def update_plan(self, tgt, plan):
+        '''
+        Same as ``update`` with the compiled data of a ``DataPlan``.
+        '''
+        if tgt not in self._data:
+            raise ValueError('key "%s" not initialized in data' % tgt)
+        data = self._data[tgt]
+        for step in plan.steps:
+            kind, key, val = step[:3]
+            if kind == DataPlan.ACTION:
+                key, val = self.get_action(tgt, step[3], key, val, step[4])
+            elif kind == DataPlan.CLEAN:
+                key, val = self.clean_val(tgt, key, deepcopy(val))
+            elif isinstance(val, (dict, list)):
+                val = deepcopy(val)
+            data[key] = val
+
     def clean_val(self, tgt, key, val):
         if isinstance(val, dict):
             val = self.clean_val_dict(tgt, val)
@@ -251,21 +567,15 @@ class BaseContextHandler(object):
         return cleaned
 
     def process_global(self):
-        global_fname = '{0}.{1}'.format(self.global_name, self.extension)
-        target_dirs = ['']
-        target_dirs += (n for n in dirname(self.target).split('/') if n)
-        dir_name = self.get_root_path()
-        g_files = self._find_files(global_fname)
-        for folder in target_dirs:
-            dir_name = join(dir_name, folder)
-            target_fname = join(dir_name, global_fname)
-            if target_fname in g_files:
-                self.update('global', self.get_data(target_fname))
+        for target_fname in self.find_global_files():
+            self.update_plan('global', self.load_plan(target_fname))
         return True
 
     def process_scope(self):
         try:
-            self.update('scope', self.get_data(self.get_scope_path()))
+            self.update_plan('scope', self.load_plan(self.get_scope_path()))
+        except IncludeError:
+            raise
         except Exception as e:
             current_app.logger.error('Processing scope error', exc_info=e)
             return False
@@ -276,9 +586,12 @@ class BaseContextHandler(object):
             self.update('meta', self.meta_parse(data))
 
     def process(self):
-        self.process_global()
-        self.process_scope()
-        self.process_meta()
+        with phase('process_global'):
+            self.process_global()
+        with phase('process_scope'):
+            self.process_scope()
+        with phase('process_meta'):
+            self.process_meta()
         self._processed = True
 
     def get_global(self):
@@ -301,3 +614,77 @@ class BaseContextHandler(object):
         if not self._processed:
             raise DataHandlerNotReady('data not processed')
         return self._data.get('meta', {})
+
+
+def read_data_file(file_path):
+    try:
+        value = file_reader.read(file_path)
+    except FileTooLargeError as e:
+        current_app.logger.warning('read action refused: %s' % e)
+        return 'file too large: %s' % file_path
+    if value is None:
+        return 'no such file: %s' % file_path
+    return value
+
+
+def get_include_registry():
+    '''
+    Handlers of the targets included during the current request.
+    '''
+    if not has_app_context():
+        return {}
+    registry = g.get('_dynrender_includes')
+    if registry is None:
+        registry = g._dynrender_includes = {}
+    return registry
+
+
+def get_prefetched_plans():
+    '''
+    Plans loaded by ``prefetch`` or from the data snapshot during the
+    current request.
+    '''
+    if not has_app_context():
+        return {}
+    plans = g.get('_dynrender_plans')
+    if plans is None:
+        plans = g._dynrender_plans = {}
+    return plans
+
+
+def _record_lazy(ctx_hdl):
+    # resolved while rendering, after the context was cached
+    if not has_app_context():
+        return
+    resolved = g.get('_dynrender_lazy')
+    if resolved is None:
+        resolved = g._dynrender_lazy = [{}, False]
+    resolved[0].update(ctx_hdl.dependencies)
+    resolved[1] = resolved[1] or ctx_hdl.volatile
+
+
+def pop_lazy_dependencies():
+    '''
+    Return ``(dependencies, volatile)`` of the lazy values resolved since
+    the last call in the current request.
+    '''
+    if not has_app_context():
+        return {}, False
+    resolved = g.pop('_dynrender_lazy', None)
+    return tuple(resolved) if resolved else ({}, False)
+
+
+def _lazy_include(cls, inc_tgt, stack):
+    ctx_hdl = cls.load_include(inc_tgt, stack)
+    _record_lazy(ctx_hdl)
+    return deepcopy(ctx_hdl.get_scope())
+
+
+def _lazy_get(cls, inc_tgt, get_name, default, stack):
+    ctx_hdl = cls.load_include(inc_tgt, stack)
+    _record_lazy(ctx_hdl)
+    scope = ctx_hdl.get_scope()
+    try:
+        return deepcopy(cls.get_included_value(scope, inc_tgt, get_name))
+    except (IndexError, KeyError):
+        return default
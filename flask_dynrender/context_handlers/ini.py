@@ -1,6 +1,7 @@
 import re
 from configparser import ConfigParser, ExtendedInterpolation
 from flask import current_app
+from ..parsers import read_bytes
 from .base import BaseContextHandler
 
 
@@ -8,6 +9,7 @@ class IniContextHandler(BaseContextHandler):
 
     ENCODING = 'utf-8'
     extension = 'ini'
+    decodes_values = True
     _list_reg = re.compile(
         r'^(?P<root>[a-zA-Z_0-9]+)\:(?P<index>[0-9]+)$')
     _dict_reg = re.compile(
@@ -78,7 +80,11 @@ class IniContextHandler(BaseContextHandler):
             interpolation=ExtendedInterpolation(),
             inline_comment_prefixes=(';#',)
         )
-        conf.read(target, encoding=self.ENCODING)
+        try:
+            raw = read_bytes(target)
+        except OSError:
+            raw = b''
+        conf.read_string(raw.decode(self.ENCODING), source=target)
         data = {}
         _keys = conf.sections()
         dict_items = self._find_dict_keys(_keys)
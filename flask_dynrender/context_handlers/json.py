@@ -1,4 +1,3 @@
-import json
 from flask import current_app
 from .base import BaseContextHandler
 
@@ -6,9 +5,7 @@ from .base import BaseContextHandler
 class JsonContextHandler(BaseContextHandler):
 
     extension = 'json'
+    parser_format = 'json'
 
     def get_root_path(self):
         return current_app.config.get('JSON_DATA_DIR', super().get_root_path())
-
-    def get_data(self, target):
-        return json.load(open(target))
@@ -0,0 +1,151 @@
+from copy import deepcopy
+from flask.json.provider import DefaultJSONProvider
+
+
+class LazyValue(object):
+    '''
+    Proxy of the value returned by ``loader()``, called on first access and
+    kept for the lifetime of the proxy (a context is deep copied per request
+    so a value is loaded at most once per request). Attribute, item, length,
+    iteration, truth, string, comparison and arithmetic access from
+    templates are forwarded.
+    '''
+    __slots__ = ('_loader', '_value', '_resolved')
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._value = None
+        self._resolved = False
+
+    def resolve(self):
+        if not self._resolved:
+            self._value = self._loader()
+            self._resolved = True
+        return self._value
+
+    def __deepcopy__(self, memo):
+        copy = LazyValue(self._loader)
+        if self._resolved:
+            copy._value = deepcopy(self._value, memo)
+            copy._resolved = True
+        return copy
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __getitem__(self, key):
+        return self.resolve()[key]
+
+    def __iter__(self):
+        return iter(self.resolve())
+
+    def __len__(self):
+        return len(self.resolve())
+
+    def __contains__(self, item):
+        return item in self.resolve()
+
+    def __bool__(self):
+        return bool(self.resolve())
+
+    def __str__(self):
+        return str(self.resolve())
+
+    def __repr__(self):
+        return repr(self.resolve())
+
+    def __eq__(self, other):
+        return self.resolve() == resolve(other)
+
+    def __ne__(self, other):
+        return self.resolve() != resolve(other)
+
+    def __hash__(self):
+        return hash(self.resolve())
+
+    def __add__(self, other):
+        return self.resolve() + resolve(other)
+
+    def __radd__(self, other):
+        return resolve(other) + self.resolve()
+
+    def __lt__(self, other):
+        return self.resolve() < resolve(other)
+
+    def __le__(self, other):
+        return self.resolve() <= resolve(other)
+
+    def __gt__(self, other):
+        return self.resolve() > resolve(other)
+
+    def __ge__(self, other):
+        return self.resolve() >= resolve(other)
+
+    def __sub__(self, other):
+        return self.resolve() - resolve(other)
+
+    def __rsub__(self, other):
+        return resolve(other) - self.resolve()
+
+    def __mul__(self, other):
+        return self.resolve() * resolve(other)
+
+    def __rmul__(self, other):
+        return resolve(other) * self.resolve()
+
+    def __truediv__(self, other):
+        return self.resolve() / resolve(other)
+
+    def __rtruediv__(self, other):
+        return resolve(other) / self.resolve()
+
+    def __floordiv__(self, other):
+        return self.resolve() // resolve(other)
+
+    def __rfloordiv__(self, other):
+        return resolve(other) // self.resolve()
+
+    def __mod__(self, other):
+        return self.resolve() % resolve(other)
+
+    def __rmod__(self, other):
+        return resolve(other) % self.resolve()
+
+    def __pow__(self, other):
+        return self.resolve() ** resolve(other)
+
+    def __neg__(self):
+        return -self.resolve()
+
+    def __pos__(self):
+        return +self.resolve()
+
+    def __abs__(self):
+        return abs(self.resolve())
+
+    def __int__(self):
+        return int(self.resolve())
+
+    def __float__(self):
+        return float(self.resolve())
+
+    def __round__(self, ndigits=None):
+        return round(self.resolve(), ndigits)
+
+
+def resolve(value):
+    if isinstance(value, LazyValue):
+        return value.resolve()
+    return value
+
+
+class LazyJSONProvider(DefaultJSONProvider):
+    '''
+    JSON provider resolving the lazy values (``tojson`` filter, ``jsonify``).
+    '''
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, LazyValue):
+            return o.resolve()
+        return DefaultJSONProvider.default(o)
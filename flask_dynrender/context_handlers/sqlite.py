@@ -0,0 +1,156 @@
+import os
+import json
+import sqlite3
+import threading
+from os.path import join, dirname, splitext, relpath, abspath
+from tempfile import mkstemp
+from urllib.parse import quote
+from flask import current_app
+from ..cache import file_signature
+from .base import BaseContextHandler
+
+SCHEMA = (
+    'CREATE TABLE documents ('
+    ' kind TEXT NOT NULL, path TEXT NOT NULL, dir TEXT NOT NULL,'
+    ' decode INTEGER NOT NULL DEFAULT 0, data TEXT NOT NULL,'
+    ' PRIMARY KEY (kind, path)) WITHOUT ROWID',
+    'CREATE INDEX documents_dir ON documents (kind, dir)',
+)
+
+_local = threading.local()
+
+
+def get_connection(db_path):
+    '''
+    Read only connection to ``db_path`` for the current thread, opened again
+    when the database file is replaced.
+    '''
+    sig = file_signature(db_path)
+    conns = getattr(_local, 'connections', None)
+    if conns is None or _local.pid != os.getpid():
+        conns = _local.connections = {}
+        _local.pid = os.getpid()
+    conn, conn_sig = conns.get(db_path, (None, None))
+    if conn is not None and conn_sig == sig:
+        return conn
+    if conn is not None:
+        conn.close()
+    conn = sqlite3.connect(
+        'file:%s?mode=ro' % quote(abspath(db_path)), uri=True)
+    conns[db_path] = (conn, sig)
+    return conn
+
+
+class SqliteContextHandler(BaseContextHandler):
+    '''
+    Data documents stored in one SQLite database (``SQLITE_DATA_FILE``)
+    instead of a tree of files: ``global`` documents keyed by folder and
+    ``scope`` documents keyed by target (without extension).
+    The documents go through the same actions as the files ones.
+    '''
+    extension = 'sqlite'
+
+    def get_database_path(self):
+        return current_app.config.get('SQLITE_DATA_FILE') or join(
+            self.get_root_path(), 'data.sqlite')
+
+    def get_source_file(self, target):
+        return target[0]
+
+    def get_snapshot(self):
+        return None
+
+    def _query(self, sql, params):
+        return get_connection(self.get_database_path()).execute(sql, params)
+
+    def find_global_files(self):
+        '''
+        Global documents from the root folder down to the target folder, in
+        merge order (one primary key lookup per level).
+        '''
+        db_path = self.get_database_path()
+        target_dirs = [n for n in dirname(self.target).split('/') if n]
+        g_docs = []
+        for i in range(len(target_dirs) + 1):
+            folder = '/'.join(target_dirs[:i])
+            row = self._query(
+                'SELECT 1 FROM documents WHERE kind = ? AND path = ?',
+                ('global', folder)).fetchone()
+            if row is not None:
+                g_docs.append((db_path, 'global', folder))
+        self.add_dependency(db_path)
+        return g_docs
+
+    def get_scope_path(self):
+        return (
+            self.get_database_path(), 'scope',
+            splitext(self.target)[0].strip('/'))
+
+    def list_scopes(self, folder):
+        return [
+            path.rsplit('/', 1)[-1] for path, in self._query(
+                'SELECT path FROM documents WHERE kind = ? AND dir = ? '
+                'ORDER BY path', ('scope', folder.strip('/')))]
+
+    def _decode(self, data):
+        if isinstance(data, dict):
+            return {k: self._decode(v) for k, v in data.items()}
+        if isinstance(data, list):
+            return [self._decode(v) for v in data]
+        return self.parse_value(data)
+
+    def get_data(self, target):
+        _, kind, path = target
+        row = self._query(
+            'SELECT decode, data FROM documents WHERE kind = ? AND path = ?',
+            (kind, path)).fetchone()
+        if row is None:
+            return {}
+        data = self.parsers.loads('json', row[1])
+        return self._decode(data) if row[0] else data
+
+
+def import_tree(db_path, root, handler_cls):
+    '''
+    Write the data files of ``handler_cls`` found under ``root`` into a new
+    database replacing ``db_path``, return the number of documents.
+    '''
+    handler = handler_cls('')
+    decode = handler.decodes_values
+    if decode:
+        # values are decoded when read back from the database
+        handler.parse_value = lambda value: value
+    ext = '.%s' % handler.extension
+    folder = dirname(abspath(db_path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = mkstemp(dir=folder, suffix='.sqlite')
+    os.close(fd)
+    count = 0
+    try:
+        conn = sqlite3.connect(tmp)
+        with conn:
+            for sql in SCHEMA:
+                conn.execute(sql)
+            for path, dirs, files in os.walk(root):
+                dirs.sort()
+                rel_dir = relpath(path, root).replace(os.sep, '/')
+                rel_dir = '' if rel_dir == '.' else rel_dir
+                for fname in sorted(files):
+                    name, f_ext = splitext(fname)
+                    if f_ext != ext:
+                        continue
+                    data = handler.get_data(join(path, fname))
+                    doc = ('global', rel_dir)
+                    if name != handler.global_name:
+                        doc = ('scope', join(rel_dir, name).replace(
+                            os.sep, '/'))
+                    conn.execute(
+                        'INSERT INTO documents VALUES (?, ?, ?, ?, ?)',
+                        doc + (rel_dir, int(decode), json.dumps(data)))
+                    count += 1
+        conn.close()
+        os.replace(tmp, db_path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+    return count
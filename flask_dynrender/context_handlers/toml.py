@@ -0,0 +1,11 @@
+from flask import current_app
+from .base import BaseContextHandler
+
+
+class TomlContextHandler(BaseContextHandler):
+
+    extension = 'toml'
+    parser_format = 'toml'
+
+    def get_root_path(self):
+        return current_app.config.get('TOML_DATA_DIR', super().get_root_path())
@@ -0,0 +1,11 @@
+from flask import current_app
+from .base import BaseContextHandler
+
+
+class YamlContextHandler(BaseContextHandler):
+
+    extension = 'yaml'
+    parser_format = 'yaml'
+
+    def get_root_path(self):
+        return current_app.config.get('YAML_DATA_DIR', super().get_root_path())
@@ -8,3 +8,15 @@ class ConfigurationError(ValueError):
 
 class ConfigrationMailError(ValueError):
     pass
+
+
+class FileTooLargeError(ValueError):
+    pass
+
+
+class IncludeError(ValueError):
+    pass
+
+
+class IncludeCycleError(IncludeError):
+    pass
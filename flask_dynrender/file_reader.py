@@ -0,0 +1,64 @@
+from os import stat
+from stat import S_ISREG
+from .cache import FileCache
+from .exceptions import FileTooLargeError
+
+
+class FileReader(object):
+    '''
+    Read text files through a ``FileCache`` (entries bound to the file
+    mtime and size), files bigger than ``max_size`` (0 for no limit) are
+    refused.
+    '''
+    encoding = 'utf-8'
+
+    def __init__(
+        self, max_entries=256, max_bytes=16 * 1024 * 1024,
+        max_size=1024 * 1024
+    ):
+        self.cache = FileCache(max_entries, max_bytes)
+        self.max_size = max_size
+        self.refused = 0
+
+    def configure(self, max_entries=None, max_bytes=None, max_size=None):
+        self.cache.configure(max_entries, max_bytes)
+        if max_size is not None:
+            self.max_size = int(max_size)
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        # same newlines as a file opened in text mode
+        return raw.decode(self.encoding).replace(
+            '\r\n', '\n').replace('\r', '\n')
+
+    def read(self, path, default=None):
+        '''
+        Return the content of ``path``, ``default`` if it is not a file.
+        '''
+        content, sig = self.cache.get_file(path, path)
+        if content is not None:
+            return content
+        try:
+            st = stat(path)
+        except OSError:
+            return default
+        if not S_ISREG(st.st_mode):
+            return default
+        sig = st.st_mtime_ns, st.st_size
+        if self.max_size and st.st_size > self.max_size:
+            self.refused += 1
+            raise FileTooLargeError(
+                '%s: %s bytes, limit %s' % (path, st.st_size, self.max_size))
+        content = self._read(path)
+        self.cache.set_file(path, sig, content, st.st_size)
+        return content
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats.update(max_size=self.max_size, refused=self.refused)
+        return stats
+
+
+# process wide reader of the ``read`` filter and ``!read_`` action
+file_reader = FileReader()
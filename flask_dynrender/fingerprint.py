@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import time
+import shutil
+from hashlib import sha256
+from os.path import join, relpath, splitext
+from tempfile import mkstemp
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from flask import request
+from .cache import file_signature
+from .compression import is_variant
+
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+IMMUTABLE_MAX_AGE = 31536000
+hashed_re = re.compile(r'\.[0-9a-f]{%s}(\.[^./]+)?$' % HASH_LENGTH)
+
+
+def _file_hash(path):
+    digest = sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def build_bundles(app, assets, workers=None):
+    '''
+    Build every bundle of ``assets`` with a thread pool, return
+    ``(count, failures)``.
+    '''
+    def build(bundle):
+        with app.app_context():
+            try:
+                bundle.build(force=True)
+            except Exception as e:
+                return bundle, e
+        return bundle, None
+
+    bundles = list(assets)
+    with ThreadPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        results = list(pool.map(build, bundles))
+    return len(bundles), [r for r in results if r[1] is not None]
+
+
+def fingerprint(static_folder, manifest_name=MANIFEST_NAME, workers=None):
+    '''
+    Copy every static file to a name holding the hash of its content
+    (``app.<hash>.js``) and write the ``{name: hashed name}`` manifest,
+    return the manifest.
+    '''
+    names = []
+    for folder, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for fname in sorted(files):
+            name = relpath(join(folder, fname), static_folder)
+            if name == manifest_name or fname.startswith('.') or \
+                    hashed_re.search(fname) or is_variant(join(folder, fname)):
+                continue
+            names.append(name.replace(os.sep, '/'))
+
+    def copy(name):
+        src = join(static_folder, name)
+        base, ext = splitext(name)
+        hashed = '%s.%s%s' % (base, _file_hash(src), ext)
+        dst = join(static_folder, hashed)
+        if not os.path.exists(dst):
+            shutil.copy2(src, dst)
+        return name, hashed
+
+    with ThreadPoolExecutor(workers or os.cpu_count() or 1) as pool:
+        manifest = dict(pool.map(copy, names))
+    fd, tmp = mkstemp(dir=static_folder, suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, join(static_folder, manifest_name))
+    return manifest
+
+
+class AssetManifest(object):
+    '''
+    ``{name: hashed name}`` of the static files, read again when the
+    manifest file changes (checked every ``check_interval`` seconds).
+    '''
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = Lock()
+        self._sig = None
+        self._checked = 0.0
+        self.names = {}
+        self.hashed = frozenset()
+        self.refresh()
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return False
+        with self._lock:
+            self._checked = now
+            sig = file_signature(self.path)
+            if sig == self._sig:
+                return False
+            names = {}
+            if sig is not None:
+                with open(self.path) as f:
+                    names = json.load(f)
+            self.names, self.hashed = names, frozenset(names.values())
+            self._sig = sig
+        return True
+
+    def get(self, name):
+        self.refresh()
+        return self.names.get(name, name)
+
+    def is_hashed(self, name):
+        self.refresh()
+        return name in self.hashed
+
+
+def _immutable_headers(app):
+    def after_request(response):
+        if request.endpoint != 'static' or response.status_code != 200:
+            return response
+        filename = (request.view_args or {}).get('filename', '')
+        if app.asset_manifest.is_hashed(filename):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+    return after_request
+
+
+def get_manifest_path(app):
+    return join(
+        app.static_folder, app.config.get('STATIC_MANIFEST') or MANIFEST_NAME)
+
+
+def init_manifest(app):
+    '''
+    Load the manifest written by ``flask dynrender assets`` as
+    ``app.asset_manifest`` (empty until the file exists): ``url_static``
+    then serves the hashed files, with immutable cache headers. Bundles are
+    no longer built on the request path when it exists at startup.
+    '''
+    path = get_manifest_path(app)
+    app.asset_manifest = AssetManifest(
+        path, float(app.config.get('STATIC_MANIFEST_CHECK', 1) or 0))
+    if os.path.isfile(path):
+        app.config['ASSETS_AUTO_BUILD'] = False
+    app.after_request(_immutable_headers(app))
+    app.logger.debug('asset manifest: %s (%s files)' % (
+        path, len(app.asset_manifest.names)))
+    return app.asset_manifest
@@ -0,0 +1,153 @@
+import datetime
+from threading import Lock
+from babel import Locale
+from babel.dates import format_time as bd_format_time
+from babel.dates import format_datetime as bd_format_datetime
+from babel.dates import format_timedelta as bd_format_timedelta
+from babel.dates import get_date_format, get_time_format, \
+    get_datetime_format, parse_pattern, UTC
+from flask import current_app, request, g, has_request_context
+
+DEFAULT_LOCALE = 'fr'
+PREDEFINED_FORMATS = ('full', 'long', 'medium', 'short')
+
+
+class DateFormatter(object):
+    '''
+    Babel date formatting with the ``Locale`` objects and the parsed
+    patterns cached per (locale, format), the output is the one of
+    ``babel.dates``.
+    '''
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._locales = {}
+        self._patterns = {}
+
+    def _memo(self, memo, key, build):
+        try:
+            return memo[key]
+        except KeyError:
+            pass
+        value = build()
+        with self._lock:
+            if len(memo) >= self.max_entries:
+                memo.clear()
+            memo[key] = value
+        return value
+
+    def get_locale(self, lcl):
+        if isinstance(lcl, Locale):
+            return lcl
+        return self._memo(
+            self._locales, lcl, lambda: Locale.parse(lcl.replace('-', '_')))
+
+    def get_pattern(self, kind, fmt, locale):
+        '''
+        Parsed pattern of ``fmt`` (a predefined format name or a pattern)
+        for ``kind`` ``date`` or ``time``.
+        '''
+        def build():
+            if fmt not in PREDEFINED_FORMATS:
+                return parse_pattern(fmt)
+            if kind == 'date':
+                return get_date_format(fmt, locale=locale)
+            return get_time_format(fmt, locale=locale)
+        return self._memo(self._patterns, (str(locale), kind, fmt), build)
+
+    def get_datetime_format(self, fmt, locale):
+        return self._memo(
+            self._patterns, (str(locale), 'datetime', fmt),
+            lambda: get_datetime_format(fmt, locale=locale).replace("'", ''))
+
+    def format_date(self, d, fmt, lcl):
+        locale = self.get_locale(lcl)
+        if d is None:
+            d = datetime.date.today()
+        elif isinstance(d, datetime.datetime):
+            d = d.date()
+        return self.get_pattern('date', fmt, locale).apply(d, locale)
+
+    def format_time(self, tm, fmt, lcl):
+        locale = self.get_locale(lcl)
+        pattern = self.get_pattern('time', fmt, locale)
+        if isinstance(tm, datetime.datetime):
+            if tm.tzinfo is None:
+                tm = tm.replace(tzinfo=UTC)
+            return pattern.apply(tm.timetz(), locale, reference_date=tm.date())
+        if isinstance(tm, datetime.time):
+            if tm.tzinfo is None:
+                tm = tm.replace(tzinfo=UTC)
+            return pattern.apply(tm, locale)
+        return bd_format_time(tm, pattern, locale=locale)
+
+    def format_datetime(self, dt, fmt, lcl):
+        locale = self.get_locale(lcl)
+        if not isinstance(dt, datetime.datetime):
+            return bd_format_datetime(dt, fmt, locale=locale)
+        if fmt not in PREDEFINED_FORMATS:
+            return bd_format_datetime(
+                dt, self.get_pattern('datetime', fmt, locale), locale=locale)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=UTC)
+        return self.get_datetime_format(fmt, locale).replace(
+            '{0}', self.format_time(dt, fmt, locale)).replace(
+            '{1}', self.format_date(dt, fmt, locale))
+
+    def format_timedelta(self, tm, lcl, **kwargs):
+        return bd_format_timedelta(tm, locale=self.get_locale(lcl), **kwargs)
+
+
+date_formatter = DateFormatter()
+
+
+def get_locales(app):
+    return [
+        lcl.strip() for lcl in str(app.config.get('LOCALES') or '').split(',')
+        if lcl.strip()]
+
+
+def get_locale():
+    '''
+    Locale of the filters: the best ``Accept-Language`` match among
+    ``LOCALES`` when ``LOCALE_FROM_REQUEST`` is set, ``DEFAULT_LOCALE``
+    otherwise. Selected once per request.
+    '''
+    default = current_app.config.get('DEFAULT_LOCALE', DEFAULT_LOCALE)
+    if not has_request_context():
+        return default
+    lcl = g.get('_dynrender_locale')
+    if lcl is None:
+        lcl = default
+        if current_app.config.get('LOCALE_FROM_REQUEST'):
+            lcl = request.accept_languages.best_match(
+                get_locales(current_app), default)
+        g._dynrender_locale = lcl
+    return lcl
+
+
+def request_locale_key():
+    '''
+    Locale to add to the cache keys of the page, None when it does not
+    depend on the request.
+    '''
+    if not current_app.config.get('LOCALE_FROM_REQUEST'):
+        return None
+    return get_locale()
+
+
+def _add_vary(response):
+    response.vary.add('Accept-Language')
+    return response
+
+
+def init_locale(app):
+    '''
+    Responses vary on ``Accept-Language`` when ``LOCALE_FROM_REQUEST``.
+    '''
+    if app.config.get('LOCALE_FROM_REQUEST'):
+        app.after_request(_add_vary)
+        app.logger.debug('locales: %s (default %s)' % (
+            ', '.join(get_locales(app)),
+            app.config.get('DEFAULT_LOCALE', DEFAULT_LOCALE)))
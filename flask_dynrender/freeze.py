@@ -0,0 +1,112 @@
+import os
+import time
+import multiprocessing
+from os import walk, makedirs
+from os.path import join, splitext, relpath, dirname
+from concurrent.futures import ProcessPoolExecutor
+from .compression import write_variants
+
+_worker_app = None
+
+
+def iter_targets(app, viewcls):
+    '''
+    Yield every renderable target: each visible template, plus each data file
+    of a folder rendered through a ``_pattern_`` template.
+    '''
+    tpl_ext = '.%s' % viewcls.TPL_EXT
+    pattern = '_pattern_%s' % tpl_ext
+    hidden = tuple(viewcls.hidden_prefix)
+    ctx_hdl = viewcls.ctx_handler_class('')
+    for folder, dirs, files in walk(app.template_folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(hidden))
+        rel_dir = relpath(folder, app.template_folder)
+        rel_dir = '' if rel_dir == '.' else rel_dir
+        names = set()
+        for fname in sorted(files):
+            name, ext = splitext(fname)
+            if ext == tpl_ext and not fname.startswith(hidden):
+                names.add(name)
+                yield join(rel_dir, '%s.%s' % (name, viewcls.ext_uri))
+        if pattern not in files:
+            continue
+        for name in ctx_hdl.list_scopes(rel_dir):
+            if name.startswith(hidden) or name in names:
+                continue
+            yield join(rel_dir, '%s.%s' % (name, viewcls.ext_uri))
+
+
+def _init_worker(conf_file, name):
+    global _worker_app
+    if _worker_app is None:
+        from . import create_app
+        _worker_app = create_app(conf_file, name)
+
+
+def render_target(target, out_dir, no_form=True):
+    '''
+    Render ``target`` through the application views and write it under
+    ``out_dir``, return ``(target, status, seconds, error)``.
+    '''
+    client = _worker_app.test_client()
+    start = time.perf_counter()
+    try:
+        resp = client.get(
+            '/%s' % target, environ_overrides={'dynrender.no_form': no_form})
+        if resp.status_code != 200:
+            return target, resp.status_code, time.perf_counter() - start, ''
+        dst = join(out_dir, target)
+        makedirs(dirname(dst), exist_ok=True)
+        data = resp.get_data()
+        with open(dst, 'wb') as f:
+            f.write(data)
+        compressor = getattr(_worker_app, 'compressor', None)
+        if compressor is not None:
+            write_variants(compressor, dst, data)
+    except Exception as e:
+        return target, 500, time.perf_counter() - start, repr(e)
+    return target, 200, time.perf_counter() - start, ''
+
+
+def freeze(app, out_dir, workers=None, contact='skip'):
+    '''
+    Render every target of ``app`` into ``out_dir`` using a process pool,
+    ``contact`` is ``skip`` to ignore the contact uris or ``noform`` to
+    render them without their form.
+    '''
+    global _worker_app
+    from . import get_view_class
+    viewcls = get_view_class(app)
+    if viewcls is None:
+        raise ValueError('No view class configured')
+    targets = list(iter_targets(app, viewcls))
+    contact_targets = {
+        viewcls().clean_target(uri.lstrip('/'))
+        for uri in getattr(app, 'contact_uris', [])}
+    if contact == 'skip':
+        targets = [t for t in targets if t not in contact_targets]
+    workers = workers or os.cpu_count() or 1
+    results = []
+    start = time.perf_counter()
+    _worker_app = app
+    if workers == 1:
+        results = [render_target(t, out_dir) for t in targets]
+    else:
+        methods = multiprocessing.get_all_start_methods()
+        mp_ctx = multiprocessing.get_context(
+            'fork' if 'fork' in methods else None)
+        with ProcessPoolExecutor(
+            workers, mp_context=mp_ctx, initializer=_init_worker,
+            initargs=(app.conf_file, app.import_name)
+        ) as pool:
+            results = list(pool.map(
+                render_target, targets, [out_dir] * len(targets),
+                chunksize=max(1, len(targets) // (workers * 8))))
+    elapsed = time.perf_counter() - start
+    return {
+        'pages': len(results),
+        'seconds': elapsed,
+        'pages_per_sec': len(results) / elapsed if elapsed else 0.0,
+        'failures': [r for r in results if r[1] != 200],
+        'timings': sorted(results, key=lambda r: r[2], reverse=True),
+    }
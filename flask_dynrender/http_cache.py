@@ -0,0 +1,67 @@
+from hashlib import sha1
+from datetime import datetime, timezone
+from jinja2 import meta
+from jinja2.exceptions import TemplateNotFound
+from .cache import DependencyCache, file_signature
+
+# template name -> names of the templates it extends, includes or imports
+template_refs_cache = DependencyCache(max_entries=4096)
+
+
+def _template_refs(env, name):
+    refs = template_refs_cache.get_valid(name)
+    if refs is not None:
+        return refs
+    source, filename, _ = env.loader.get_source(env, name)
+    names = tuple(meta.find_referenced_templates(env.parse(source)))
+    refs = (filename, names)
+    template_refs_cache.set_valid(
+        name, {filename: file_signature(filename)}, refs)
+    return refs
+
+
+def template_dependencies(env, name):
+    '''
+    Return ``{filename: signature}`` of the template ``name`` and of every
+    template it references, None if a reference can't be resolved
+    statically.
+    '''
+    deps = {}
+    todo, seen = [name], set()
+    while todo:
+        current = todo.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        try:
+            filename, names = _template_refs(env, current)
+        except TemplateNotFound:
+            return None
+        if filename is None or None in names:
+            return None
+        deps[filename] = file_signature(filename)
+        todo.extend(names)
+    return deps
+
+
+def compute_validator(key, dependencies):
+    '''
+    Return ``(etag, last_modified)`` built from the signatures of
+    ``dependencies`` (``{path: signature}``).
+    '''
+    items = sorted(dependencies.items())
+    etag = sha1(repr((key, items)).encode('utf-8')).hexdigest()
+    mtimes = [sig[0] for _, sig in items if sig is not None]
+    last_modified = None
+    if mtimes:
+        last_modified = datetime.fromtimestamp(
+            max(mtimes) // 1000000000, tz=timezone.utc)
+    return etag, last_modified
+
+
+def is_not_modified(request, etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return request.if_modified_since >= last_modified
+    return False
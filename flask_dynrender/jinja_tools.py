@@ -1,42 +1,49 @@
 import re
-from os.path import isfile, join
-from babel.dates import format_date as bd_format_date
-from babel.dates import format_time as bd_format_time
-from babel.dates import format_datetime as bd_format_datetime
-from babel.dates import format_timedelta as bd_format_timedelta
+from os.path import join
 from flask import url_for, current_app, g
+from .exceptions import FileTooLargeError
+from .file_reader import file_reader
+from .formatting import date_formatter, get_locale
 
 
 def url_static(file_name, *args, **kwargs):
+    manifest = getattr(current_app, 'asset_manifest', None)
+    if manifest is not None:
+        file_name = manifest.get(file_name)
     return url_for('static', filename=file_name, *args, **kwargs)
 
 
-def format_date(d, fmt='medium', lcl='fr'):
-    return bd_format_date(d, format=fmt, locale=lcl)
+def format_date(d, fmt='medium', lcl=None):
+    return date_formatter.format_date(d, fmt, lcl or get_locale())
 
 
-def format_datetime(dt, fmt='medium', lcl='fr'):
-    return bd_format_datetime(dt, format=fmt, locale=lcl)
+def format_datetime(dt, fmt='medium', lcl=None):
+    return date_formatter.format_datetime(dt, fmt, lcl or get_locale())
 
 
-def format_time(tm, fmt='medium', lcl='fr'):
-    return bd_format_time(tm, format=fmt, locale=lcl)
+def format_time(tm, fmt='medium', lcl=None):
+    return date_formatter.format_time(tm, fmt, lcl or get_locale())
 
 
 def format_timedelta(
     tm, granularity='second', threshold=.85, add_direction=False,
-    format='long', lcl='fr'
+    format='long', lcl=None
 ):
-    return bd_format_timedelta(
-        tm, granularity=granularity, threshold=threshold,
-        add_direction=add_direction, format=format, locale=lcl)
+    return date_formatter.format_timedelta(
+        tm, lcl or get_locale(), granularity=granularity,
+        threshold=threshold, add_direction=add_direction, format=format)
 
 
 def read(fname, default=None):
     abs_fname = join(current_app.config.get(
         'DATA_FOLDER', current_app.template_folder), fname)
-    if isfile(abs_fname):
-        return open(abs_fname, 'r').read()
+    try:
+        content = file_reader.read(abs_fname)
+    except FileTooLargeError as e:
+        current_app.logger.warning('read filter refused: %s' % e)
+        return default or 'file too large %s' % abs_fname
+    if content is not None:
+        return content
     return default or 'no such file %s' % abs_fname
 
 
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import uuid
+import logging
+from os.path import join, isdir
+from queue import Queue, Full, Empty
+from threading import Thread, Lock
+from flask_mail import Message
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_FIELDS = (
+    'subject', 'recipients', 'body', 'html', 'sender', 'cc', 'bcc',
+    'reply_to', 'extra_headers')
+
+
+def message_to_dict(msg):
+    return {k: getattr(msg, k, None) for k in MESSAGE_FIELDS}
+
+
+def message_from_dict(data):
+    return Message(**{k: v for k, v in data.items() if v is not None})
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class MailQueue(object):
+    '''
+    Deliver messages from background threads with retries and exponential
+    backoff. With a ``spool_dir`` each message is written to disk until it
+    is sent, messages left by a dead process are picked up again.
+    '''
+    suffix = '.mail'
+
+    def __init__(
+        self, app, mail, workers=2, maxsize=100, spool_dir=None, retries=5,
+        retry_delay=2.0
+    ):
+        self.app = app
+        self.mail = mail
+        self.workers = workers
+        self.spool_dir = spool_dir
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue = Queue(maxsize)
+        self._lock = Lock()
+        self._recover_lock = Lock()
+        self._pid = None
+        self._pending = set()
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rejected = 0
+        self._latency_total = 0.0
+        self.latency_max = 0.0
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = Queue(self._queue.maxsize)
+            self._pending = set()
+            for i in range(self.workers):
+                Thread(
+                    target=self._worker, name='dynrender-mail-%s' % i,
+                    daemon=True).start()
+        self.recover()
+
+    def _spool_name(self):
+        return '%s-%s.%s%s' % (
+            time.time_ns(), uuid.uuid4().hex, os.getpid(), self.suffix)
+
+    def put(self, msg):
+        '''
+        Queue ``msg`` for delivery, return False when the queue is full (the
+        message stays in the spool if there is one).
+        '''
+        self.start()
+        data = message_to_dict(msg)
+        fname = None
+        if self.spool_dir:
+            fname = join(self.spool_dir, self._spool_name())
+            # pending before the file exists so recover() can't claim it
+            with self._recover_lock:
+                self._pending.add(fname)
+            try:
+                with open(fname, 'w') as f:
+                    json.dump(data, f)
+            except OSError:
+                self._pending.discard(fname)
+                raise
+        try:
+            self._enqueue(fname, data)
+        except Full:
+            self.rejected += 1
+            self.app.logger.error('mail queue full, message %s' % (
+                'spooled' if fname else 'dropped'))
+            return False
+        return True
+
+    def _enqueue(self, fname, data):
+        if fname:
+            self._pending.add(fname)
+        try:
+            self._queue.put_nowait((fname, data, time.time()))
+        except Full:
+            self._pending.discard(fname)
+            raise
+        self.queued += 1
+
+    def recover(self):
+        '''
+        Queue the spooled messages of dead processes and the ones this
+        process could not queue.
+        '''
+        if not self.spool_dir or not isdir(self.spool_dir):
+            return 0
+        with self._recover_lock:
+            return self._recover()
+
+    def _recover(self):
+        count = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            if self._queue.full():
+                break
+            if not name.endswith(self.suffix):
+                continue
+            base, owner = name[:-len(self.suffix)].rsplit('.', 1)
+            fname = join(self.spool_dir, '%s.%s%s' % (
+                base, os.getpid(), self.suffix))
+            if not owner.isdigit() or fname in self._pending:
+                continue
+            if int(owner) != os.getpid() and _pid_alive(int(owner)):
+                continue
+            try:
+                os.rename(join(self.spool_dir, name), fname)
+                with open(fname) as f:
+                    data = json.load(f)
+                self._enqueue(fname, data)
+            except (OSError, ValueError, Full):
+                continue
+            count += 1
+        return count
+
+    def _deliver(self, data):
+        with self.app.app_context():
+            self.mail.send(message_from_dict(data))
+
+    def _worker(self):
+        while True:
+            try:
+                fname, data, enqueued = self._queue.get(timeout=30)
+            except Empty:
+                self.recover()
+                continue
+            try:
+                self._send(fname, data, enqueued)
+            except Exception as e:
+                # keep the worker alive, it is not started again
+                logger.error('mail worker error', exc_info=e)
+            finally:
+                self._pending.discard(fname)
+                self._queue.task_done()
+
+    def _send(self, fname, data, enqueued):
+        for attempt in range(self.retries + 1):
+            try:
+                self._deliver(data)
+            except Exception as e:
+                logger.warning(
+                    'mail delivery failed (attempt %s)' % (attempt + 1),
+                    exc_info=e)
+                if attempt < self.retries:
+                    self.retried += 1
+                    time.sleep(self.retry_delay * 2 ** attempt)
+                continue
+            latency = time.time() - enqueued
+            self.sent += 1
+            self._latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if fname:
+                self._remove_spool(fname)
+            return True
+        self.failed += 1
+        logger.error('mail delivery abandoned after %s attempts' % (
+            self.retries + 1))
+        if fname:
+            self._remove_spool(fname, fname[:-len(self.suffix)] + '.failed')
+        return False
+
+    def _remove_spool(self, fname, failed=None):
+        try:
+            if failed:
+                os.rename(fname, failed)
+            else:
+                os.unlink(fname)
+        except OSError as e:
+            logger.error('mail spool cleanup failed: %s' % e)
+
+    def join(self):
+        self._queue.join()
+
+    def stats(self):
+        return {
+            'depth': self._queue.qsize(),
+            'queued': self.queued,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'rejected': self.rejected,
+            'latency_avg': (
+                self._latency_total / self.sent if self.sent else 0.0),
+            'latency_max': self.latency_max,
+        }
+
+
+def init_mail_queue(app, mail):
+    '''
+    Create ``app.mail_queue`` when ``[mail] QUEUE`` is enabled, threads are
+    started on the first message of each process.
+    '''
+    conf = app.config.get('MAIL', {})
+    app.mail_queue = None
+    if not conf.get('QUEUE'):
+        return None
+    app.mail_queue = MailQueue(
+        app, mail,
+        workers=int(conf.get('QUEUE_WORKERS', 2)),
+        maxsize=int(conf.get('QUEUE_SIZE', 100)),
+        spool_dir=conf.get('SPOOL_DIR') or None,
+        retries=int(conf.get('RETRIES', 5)),
+        retry_delay=float(conf.get('RETRY_DELAY', 2)))
+    return app.mail_queue
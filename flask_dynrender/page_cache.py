@@ -0,0 +1,195 @@
+import os
+import time
+import json
+from hashlib import sha1
+from os.path import join, isdir
+from tempfile import mkstemp
+from .cache import LRUCache, file_signature
+from .utils import check_private
+
+
+class BaseBackend(object):
+    '''
+    Store rendered pages as ``(dependencies, body)``, an entry is served
+    while it is younger than ``ttl`` seconds (0 for no expiration) and none
+    of its dependencies (``{path: signature}``) changed.
+    '''
+
+    def __init__(self, ttl=0, max_entries=0, max_bytes=0, **kwargs):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def load(self, key):
+        raise NotImplementedError()
+
+    def store(self, key, entry):
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def get(self, key):
+        entry = self.load(key)
+        if entry is None:
+            return None
+        expires, dependencies, body = entry
+        if (expires and expires < time.time()) or not all(
+            file_signature(path) == sig
+            for path, sig in dependencies.items()
+        ):
+            self.delete(key)
+            return None
+        return body
+
+    def set(self, key, dependencies, body):
+        expires = time.time() + self.ttl if self.ttl else 0
+        self.store(key, (expires, dict(dependencies), body))
+
+    def stats(self):
+        return {}
+
+
+class MemoryBackend(BaseBackend):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._cache = LRUCache(self.max_entries or 1024, self.max_bytes)
+
+    def load(self, key):
+        return self._cache.get(key)
+
+    def store(self, key, entry):
+        self._cache.set(key, entry, len(entry[2]))
+
+    def delete(self, key):
+        self._cache.pop(key)
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class FilesystemBackend(BaseBackend):
+    '''
+    One file per page under ``path``, written atomically so it can be shared
+    by several worker processes: a JSON header line (expiry, dependencies)
+    then the body. ``path`` must be private to the user of the application.
+    '''
+    prune_every = 64
+
+    def __init__(self, path=None, **kwargs):
+        super().__init__(**kwargs)
+        if not path:
+            raise ValueError('PAGE_CACHE_DIR is required by filesystem cache')
+        self.path = path
+        self._writes = 0
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        check_private(path)
+
+    def _fname(self, key):
+        name = sha1(repr(key).encode('utf-8')).hexdigest()
+        return join(self.path, name[:2], name)
+
+    def load(self, key):
+        try:
+            with open(self._fname(key), 'rb') as f:
+                header = json.loads(f.readline())
+                body = f.read()
+            dependencies = {
+                path: tuple(sig) if sig is not None else None
+                for path, sig in header['dependencies']}
+            return header['expires'], dependencies, body
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def store(self, key, entry):
+        fname = self._fname(key)
+        folder = os.path.dirname(fname)
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+        expires, dependencies, body = entry
+        header = json.dumps({
+            'expires': expires, 'dependencies': list(dependencies.items())})
+        fd, tmp = mkstemp(dir=folder)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header.encode('utf-8') + b'\n')
+                f.write(body)
+            os.replace(tmp, fname)
+        except OSError:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            return
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self.prune()
+
+    def delete(self, key):
+        try:
+            os.unlink(self._fname(key))
+        except OSError:
+            pass
+
+    def _entries(self):
+        for folder in os.listdir(self.path):
+            folder = join(self.path, folder)
+            if not isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                try:
+                    st = os.stat(join(folder, name))
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, join(folder, name)
+
+    def prune(self):
+        '''
+        Remove the oldest pages until the entries and bytes limits are met.
+        '''
+        if not self.max_entries and not self.max_bytes:
+            return
+        entries = sorted(self._entries())
+        size = sum(e[1] for e in entries)
+        count = len(entries)
+        for _, fsize, fname in entries:
+            if (not self.max_entries or count <= self.max_entries) and (
+                    not self.max_bytes or size <= self.max_bytes):
+                break
+            try:
+                os.unlink(fname)
+            except OSError:
+                continue
+            count -= 1
+            size -= fsize
+
+    def stats(self):
+        entries = list(self._entries())
+        return {
+            'entries': len(entries),
+            'bytes': sum(e[1] for e in entries),
+        }
+
+
+backends = {
+    'memory': MemoryBackend,
+    'filesystem': FilesystemBackend,
+}
+
+
+def init_page_cache(app):
+    '''
+    Create the page cache backend named by ``PAGE_CACHE`` on ``app``.
+    '''
+    app.page_cache = None
+    name = app.config.get('PAGE_CACHE')
+    if not name:
+        return None
+    if name not in backends:
+        app.logger.error('Unknown page cache backend "%s"' % name)
+        return None
+    app.page_cache = backends[name](
+        path=app.config.get('PAGE_CACHE_DIR'),
+        ttl=float(app.config.get('PAGE_CACHE_TTL', 0) or 0),
+        max_entries=int(app.config.get('PAGE_CACHE_MAX_ENTRIES', 0) or 0),
+        max_bytes=int(app.config.get('PAGE_CACHE_MAX_BYTES', 0) or 0))
+    app.logger.debug('page cache: %s' % name)
+    return app.page_cache
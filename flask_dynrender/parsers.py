@@ -0,0 +1,127 @@
+import json
+import logging
+from importlib import import_module
+
+logger = logging.getLogger(__name__)
+
+
+class ParserRegistry(object):
+    '''
+    Decoders of the data files by format (``json``, ``toml``...). Each
+    backend is registered with a priority, the available one with the
+    highest priority is selected the first time a format is used, unless a
+    backend is chosen by ``select``. Decoders take the raw bytes of the file.
+    '''
+
+    def __init__(self):
+        self._backends = {}
+        self._active = {}
+
+    def register(self, fmt, name, factory, priority=0):
+        '''
+        Add the backend ``name`` of ``fmt``, ``factory`` returns its decoder
+        (``loads(raw_bytes)``) or raises ImportError when not installed.
+        '''
+        backends = self._backends.setdefault(fmt, [])
+        backends[:] = [b for b in backends if b[1] != name]
+        backends.append((priority, name, factory))
+        backends.sort(key=lambda b: -b[0])
+        self._active.pop(fmt, None)
+
+    def formats(self):
+        return sorted(self._backends)
+
+    def select(self, fmt, preferred=None):
+        '''
+        Activate ``preferred`` (or the best available backend) for ``fmt``,
+        return its name, None if no backend is available.
+        '''
+        backends = self._backends.get(fmt, [])
+        if preferred:
+            backends = sorted(backends, key=lambda b: b[1] != preferred)
+        for _, name, factory in backends:
+            try:
+                loads = factory()
+            except ImportError:
+                if name == preferred:
+                    logger.warning(
+                        '%s parser "%s" is not installed' % (fmt, name))
+                continue
+            self._active[fmt] = (name, loads)
+            return name
+        self._active.pop(fmt, None)
+        return None
+
+    def backend(self, fmt):
+        if fmt not in self._active and self.select(fmt) is None:
+            return None
+        return self._active[fmt][0]
+
+    def loads(self, fmt, raw):
+        active = self._active.get(fmt)
+        if active is None:
+            if self.select(fmt) is None:
+                raise ValueError('No parser available for %s data' % fmt)
+            active = self._active[fmt]
+        return active[1](raw)
+
+
+def _module_attr(module, attr):
+    def factory():
+        return getattr(import_module(module), attr)
+    return factory
+
+
+def _stdlib_json():
+    return json.loads
+
+
+def _stdlib_toml():
+    loads = import_module('tomllib').loads
+    return lambda raw: loads(raw.decode('utf-8'))
+
+
+def _tomli():
+    loads = import_module('tomli').loads
+    return lambda raw: loads(raw.decode('utf-8'))
+
+
+def _pyyaml():
+    yaml = import_module('yaml')
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return lambda raw: yaml.load(raw, Loader=loader) or {}
+
+
+parsers = ParserRegistry()
+parsers.register('json', 'orjson', _module_attr('orjson', 'loads'), 30)
+parsers.register('json', 'simdjson', _module_attr('simdjson', 'loads'), 20)
+parsers.register('json', 'json', _stdlib_json, 0)
+parsers.register('toml', 'tomllib', _stdlib_toml, 10)
+parsers.register('toml', 'tomli', _tomli, 0)
+parsers.register('yaml', 'pyyaml', _pyyaml, 0)
+
+
+def register_parser(fmt, name, factory, priority=0):
+    parsers.register(fmt, name, factory, priority)
+
+
+def read_bytes(path):
+    '''
+    Read the whole file at ``path`` in a single call.
+    '''
+    with open(path, 'rb', buffering=0) as f:
+        return f.readall()
+
+
+def init_parsers(app):
+    '''
+    Select the parser of each format, ``<FORMAT>_PARSER`` (``JSON_PARSER =
+    json``) forces a backend, and log the active ones.
+    '''
+    active = []
+    for fmt in parsers.formats():
+        name = parsers.select(
+            fmt, app.config.get('%s_PARSER' % fmt.upper()))
+        active.append('%s=%s' % (fmt, name or '-'))
+    app.logger.info('data parsers: %s' % ', '.join(active))
+    return active
@@ -0,0 +1,122 @@
+import gc
+import os
+import sys
+import time
+from .cache import data_cache
+from .tree_index import get_tree_index
+
+
+def memory_usage():
+    '''
+    Resident memory of the process in bytes (peak resident memory where
+    ``/proc`` is not available), 0 when unknown.
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def preload_index(app):
+    for root in list(app.tree_indexes) + [app.template_folder]:
+        get_tree_index(app, root).refresh()
+    return sum(index.dir_count() for index in app.tree_indexes.values())
+
+
+def preload_routes(app):
+    if app.route_table is None:
+        return 0
+    app.route_table.refresh()
+    return len(app.route_table.targets)
+
+
+def preload_data(app):
+    '''
+    Process the context of every target so each data file (includes
+    too) is parsed into ``data_cache``, return the number of targets.
+    '''
+    from . import get_view_class
+    from .freeze import iter_targets
+    viewcls = get_view_class(app)
+    if viewcls is None:
+        return 0
+    with app.app_context():
+        targets = list(iter_targets(app, viewcls))
+    count = 0
+    for target in targets:
+        # an application context (so a ``g``) per target, as per request
+        with app.app_context():
+            try:
+                viewcls.ctx_handler_class(target, identifier=target).process()
+            except Exception as e:
+                app.logger.warning('preload of %s failed: %s' % (target, e))
+                continue
+        count += 1
+    return count
+
+
+def preload_templates(app):
+    from .templates import warmup_templates
+    return warmup_templates(app)[0]
+
+
+def freeze_objects(app):
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+def preload_app(app):
+    '''
+    Build the indexes and the route table, parse every data file and
+    compile every template before the server forks its workers, so they
+    share this state copy-on-write. With ``PRELOAD_GC_FREEZE`` the objects
+    are then moved out of the collector (``gc.freeze``) which would
+    otherwise touch their pages. Return ``[(stage, count, seconds,
+    memory)]``.
+    '''
+    stages = [
+        ('index', preload_index),
+        ('routes', preload_routes),
+        ('data', preload_data),
+        ('templates', preload_templates),
+    ]
+    if app.config.get('PRELOAD_GC_FREEZE') and hasattr(gc, 'freeze'):
+        stages.append(('gc', freeze_objects))
+    report = []
+    for stage, func in stages:
+        memory = memory_usage()
+        start = time.perf_counter()
+        count = func(app)
+        report.append((
+            stage, count, time.perf_counter() - start,
+            memory_usage() - memory))
+        app.logger.info('preload %s: %s in %.3fs, %+.1f MiB' % (
+            stage, count, report[-1][2], report[-1][3] / 1048576.0))
+    if not data_cache.enabled:
+        app.logger.warning('preload: the data cache is disabled')
+    return report
+
+
+def init_preload(app, preload=None):
+    '''
+    Preload ``app`` when ``preload`` (default the ``PRELOAD`` setting) is
+    true, the report is kept as ``app.preload_report``.
+    '''
+    app.preload_report = None
+    if preload is None:
+        preload = app.config.get('PRELOAD')
+    if not preload:
+        return None
+    start = time.perf_counter()
+    app.preload_report = preload_app(app)
+    app.logger.info('preload done in %.3fs, %.1f MiB resident' % (
+        time.perf_counter() - start, memory_usage() / 1048576.0))
+    return app.preload_report
@@ -0,0 +1,69 @@
+from os.path import splitext, dirname, basename
+from threading import Lock
+from .tree_index import get_tree_index
+
+
+class RouteTable(object):
+    '''
+    Map every target of the view class to its template, built from the
+    template tree index and rebuilt when it changes.
+    Targets of a folder holding a ``_pattern_`` template are all valid.
+    '''
+
+    def __init__(self, app, viewcls):
+        self.app = app
+        self.viewcls = viewcls
+        self.tpl_ext = '.%s' % viewcls.TPL_EXT
+        self.pattern = '_pattern_%s' % self.tpl_ext
+        self.tpl_index = get_tree_index(app, app.template_folder)
+        self._lock = Lock()
+        self._generation = None
+        self.targets = {}
+        self.pattern_dirs = {}
+
+    def build(self):
+        targets, pattern_dirs = {}, {}
+        for path in self.tpl_index.iter_files():
+            if not path.endswith(self.tpl_ext):
+                continue
+            if basename(path) == self.pattern:
+                pattern_dirs[dirname(path)] = path
+            else:
+                targets['%s.%s' % (
+                    splitext(path)[0], self.viewcls.ext_uri)] = path
+        self.targets, self.pattern_dirs = targets, pattern_dirs
+        return self
+
+    def refresh(self):
+        generation = self.tpl_index.generation
+        if generation == self._generation:
+            return False
+        with self._lock:
+            if generation != self._generation:
+                self.build()
+                self._generation = generation
+        return True
+
+    def get_template_name(self, target):
+        '''
+        Template rendering ``target`` (its own or the ``_pattern_`` of its
+        folder), None for an unknown target.
+        '''
+        self.refresh()
+        name = self.targets.get(target)
+        if name is None:
+            name = self.pattern_dirs.get(dirname(target))
+        return name
+
+
+def init_route_table(app, viewcls):
+    app.route_table = None
+    # opt-in: new templates are only seen once the indexes are rescanned
+    # (every DATA_INDEX_POLL seconds)
+    if not app.config.get('ROUTE_TABLE'):
+        return None
+    app.route_table = RouteTable(app, viewcls)
+    app.route_table.refresh()
+    app.logger.debug('route table: %s targets, %s pattern folders' % (
+        len(app.route_table.targets), len(app.route_table.pattern_dirs)))
+    return app.route_table
@@ -0,0 +1,150 @@
+import os
+import time
+import mmap
+import struct
+import pickle
+import logging
+from os.path import join, splitext, relpath, dirname, abspath
+from tempfile import mkstemp
+from threading import Lock
+from .cache import file_signature
+from .utils import check_private
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'DYNSNAP1'
+HEADER = struct.Struct('<8sQQ')
+
+
+def build_snapshot(out_path, root, handler):
+    '''
+    Write the ``get_data`` output of every data file of ``handler`` under
+    ``root`` into the snapshot ``out_path`` (replaced atomically), files
+    with volatile values (``Date(now)``) are left out. Return ``(entries,
+    skipped)``.
+    '''
+    ext = '.%s' % handler.extension
+    folder = dirname(abspath(out_path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = mkstemp(dir=folder, suffix='.snapshot')
+    entries, skipped = {}, 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, 0, 0))
+            for path, dirs, files in os.walk(root):
+                dirs.sort()
+                for fname in sorted(files):
+                    if splitext(fname)[1] != ext:
+                        continue
+                    fpath = join(path, fname)
+                    sig = file_signature(fpath)
+                    handler._volatile_data = False
+                    data = handler.get_data(fpath)
+                    if handler._volatile_data:
+                        skipped += 1
+                        continue
+                    raw = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+                    entries[relpath(fpath, root)] = (f.tell(), len(raw), sig)
+                    f.write(raw)
+            index = pickle.dumps({
+                'handler': type(handler).__name__,
+                'created': time.time(),
+                'entries': entries,
+            }, pickle.HIGHEST_PROTOCOL)
+            offset = f.tell()
+            f.write(index)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, offset, len(index)))
+        os.replace(tmp, out_path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+    return len(entries), skipped
+
+
+class DataSnapshot(object):
+    '''
+    Read only view of a snapshot file: the file is memory mapped, so every
+    worker process shares the same pages, and an entry is unpickled when it
+    is asked for (the file must belong to the user of the application). A
+    new snapshot swapped in place is picked up within ``check_interval``
+    seconds.
+    '''
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = Lock()
+        self._state = None
+        self._checked = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _open(self, sig):
+        # entries are unpickled, only trust a file nobody else can write
+        check_private(self.path)
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, offset, length = HEADER.unpack(mm[:HEADER.size])
+        if magic != MAGIC:
+            raise ValueError('%s is not a data snapshot' % self.path)
+        index = pickle.loads(mm[offset:offset + length])
+        return sig, mm, index
+
+    def current(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return self._state
+        with self._lock:
+            self._checked = now
+            sig = file_signature(self.path)
+            state = self._state
+            if state is None or state[0] != sig:
+                # the previous map is released with its last reader
+                try:
+                    self._state = self._open(sig) if sig else None
+                except (OSError, ValueError, pickle.UnpicklingError) as e:
+                    logger.error('invalid snapshot %s: %s' % (self.path, e))
+                    self._state = None
+        return self._state
+
+    def get(self, handler_name, rel_path, sig):
+        '''
+        Data of ``rel_path`` if the snapshot holds it for the file signature
+        ``sig``, None otherwise.
+        '''
+        state = self.current()
+        if state is None or state[2]['handler'] != handler_name:
+            return None
+        entry = state[2]['entries'].get(rel_path)
+        if entry is None or entry[2] != sig:
+            self.misses += 1
+            return None
+        self.hits += 1
+        offset, length, _ = entry
+        return pickle.loads(state[1][offset:offset + length])
+
+    def stats(self):
+        state = self._state
+        return {
+            'path': self.path,
+            'entries': len(state[2]['entries']) if state else 0,
+            'created': state[2]['created'] if state else None,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+def init_snapshot(app):
+    '''
+    Create ``app.data_snapshot`` when ``DATA_SNAPSHOT`` names a snapshot
+    file (see ``flask dynrender snapshot``).
+    '''
+    path = app.config.get('DATA_SNAPSHOT')
+    app.data_snapshot = None
+    if not path:
+        return None
+    app.data_snapshot = DataSnapshot(
+        path, float(app.config.get('DATA_SNAPSHOT_CHECK', 1) or 0))
+    app.logger.debug('data snapshot: %s' % path)
+    return app.data_snapshot
@@ -0,0 +1,57 @@
+import os
+import time
+from os.path import join, relpath
+from jinja2 import FileSystemBytecodeCache
+from jinja2.environment import create_cache
+
+
+def iter_template_names(app):
+    '''
+    Names of every template of the application folder (layouts, patterns
+    and hidden ones included) and of the mail templates.
+    '''
+    from . import get_view_class
+    viewcls = get_view_class(app)
+    ext = '.%s' % (viewcls.TPL_EXT if viewcls else 'jinja2')
+    for folder, _, files in os.walk(app.template_folder):
+        for fname in sorted(files):
+            if fname.endswith(ext):
+                yield relpath(join(folder, fname), app.template_folder)
+    mail = app.config.get('MAIL', {})
+    for key in ('HTML_TPL', 'TXT_TPL'):
+        if mail.get(key):
+            yield mail[key]
+
+
+def warmup_templates(app):
+    '''
+    Load every template in ``app.jinja_env`` (and its bytecode cache),
+    return ``(count, failures, seconds)``.
+    '''
+    start = time.perf_counter()
+    count, failures = 0, []
+    for name in iter_template_names(app):
+        try:
+            app.jinja_env.get_template(name)
+        except Exception as e:
+            failures.append((name, e))
+            app.logger.error('template compilation failed: %s' % name,
+                             exc_info=e)
+            continue
+        count += 1
+    return count, failures, time.perf_counter() - start
+
+
+def init_templates(app):
+    cache_size = app.config.get('JINJA_CACHE_SIZE')
+    if cache_size is not None:
+        app.jinja_env.cache = create_cache(int(cache_size))
+    cache_dir = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        app.logger.debug('jinja bytecode cache: %s' % cache_dir)
+    if app.config.get('TEMPLATE_WARMUP'):
+        count, failures, seconds = warmup_templates(app)
+        app.logger.info('%s templates loaded in %.3fs (%s failures)' % (
+            count, seconds, len(failures)))
@@ -0,0 +1,182 @@
+import hmac
+import time
+from threading import Lock
+from collections import OrderedDict, deque
+from flask import g, request, jsonify, abort, current_app
+
+
+class _NullPhase(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_PHASE = _NullPhase()
+
+
+class PhaseTimer(object):
+    '''
+    Request timer, ``timings`` accumulates the seconds spent in each phase.
+    '''
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.target = None
+        self.timings = OrderedDict()
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def total(self):
+        return time.perf_counter() - self.start
+
+
+class Phase(object):
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def phase(name):
+    '''
+    Context manager timing ``name`` for the current request, a no-op when
+    timing is disabled.
+    '''
+    timer = g.get('_dynrender_timer') if g else None
+    if timer is None:
+        return NULL_PHASE
+    return Phase(timer, name)
+
+
+def set_target(target):
+    timer = g.get('_dynrender_timer') if g else None
+    if timer is not None:
+        timer.target = target
+
+
+class TimingStats(object):
+    '''
+    Last ``size`` samples of each phase per target, for at most
+    ``max_targets`` targets (least recently seen dropped first).
+    '''
+
+    def __init__(self, size=512, max_targets=1000):
+        self.size = size
+        self.max_targets = max_targets
+        self._targets = OrderedDict()
+        self._lock = Lock()
+
+    def record(self, target, timings):
+        with self._lock:
+            phases = self._targets.get(target)
+            if phases is None:
+                phases = self._targets[target] = {}
+                while len(self._targets) > self.max_targets:
+                    self._targets.popitem(last=False)
+            else:
+                self._targets.move_to_end(target)
+            for name, seconds in timings.items():
+                if name not in phases:
+                    phases[name] = deque(maxlen=self.size)
+                phases[name].append(seconds * 1000)
+
+    @staticmethod
+    def _percentile(samples, pct):
+        return samples[min(len(samples) - 1, int(len(samples) * pct))]
+
+    def summary(self):
+        with self._lock:
+            targets = {
+                t: {n: sorted(s) for n, s in phases.items()}
+                for t, phases in self._targets.items()}
+        return {
+            target: {
+                name: {
+                    'count': len(samples),
+                    'p50': self._percentile(samples, .50),
+                    'p95': self._percentile(samples, .95),
+                    'p99': self._percentile(samples, .99),
+                }
+                for name, samples in phases.items()
+            }
+            for target, phases in targets.items()
+        }
+
+
+def _before_request():
+    g._dynrender_timer = PhaseTimer()
+
+
+def _after_request(response):
+    timer = g.get('_dynrender_timer')
+    if timer is None or timer.target is None:
+        return response
+    timings = timer.timings.copy()
+    timings['total'] = timer.total()
+    if current_app.config.get('SERVER_TIMING'):
+        response.headers['Server-Timing'] = ', '.join(
+            '%s;dur=%.3f' % (name, seconds * 1000)
+            for name, seconds in timings.items())
+    stats = getattr(current_app, 'timing_stats', None)
+    if stats is not None and response.status_code < 400:
+        stats.record(timer.target, timings)
+    return response
+
+
+def stats_view():
+    token = current_app.config.get('STATS_TOKEN', '')
+    # header only, a query string token would end in logs and referrers
+    given = request.headers.get('Authorization', '')
+    given = given[7:] if given.startswith('Bearer ') else ''
+    if not token or not hmac.compare_digest(str(token), given):
+        abort(403)
+    from .cache import data_cache, context_cache
+    from .file_reader import file_reader
+    stats = getattr(current_app, 'timing_stats', None)
+    page_cache = getattr(current_app, 'page_cache', None)
+    mail_queue = getattr(current_app, 'mail_queue', None)
+    snapshot = getattr(current_app, 'data_snapshot', None)
+    return jsonify({
+        'targets': stats.summary() if stats is not None else {},
+        'caches': {
+            'data': data_cache.stats(),
+            'context': context_cache.stats(),
+            'page': page_cache.stats() if page_cache is not None else None,
+            'read': file_reader.stats(),
+            'snapshot': snapshot.stats() if snapshot is not None else None,
+        },
+        'mail_queue': mail_queue.stats() if mail_queue is not None else None,
+        'preload': [
+            dict(zip(('stage', 'count', 'seconds', 'memory'), stage))
+            for stage in getattr(current_app, 'preload_report', None) or ()],
+    })
+
+
+def init_timing(app):
+    '''
+    Time the request phases when SERVER_TIMING or TIMING_STATS is enabled,
+    register the stats endpoint when STATS_TOKEN is set.
+    '''
+    app.timing_stats = None
+    if app.config.get('TIMING_STATS'):
+        app.timing_stats = TimingStats(
+            int(app.config.get('TIMING_STATS_SIZE', 512)))
+    if app.config.get('SERVER_TIMING') or app.timing_stats is not None:
+        app.before_request(_before_request)
+        app.after_request(_after_request)
+    if app.config.get('STATS_TOKEN'):
+        app.add_url_rule(
+            app.config.get('STATS_ENDPOINT', '/_dynrender/stats'),
+            'dynrender_stats', stats_view)
@@ -0,0 +1,237 @@
+import os
+import time
+import logging
+from os import scandir, stat, getpid
+from os.path import join, dirname, basename, normpath
+from threading import RLock, Thread
+from weakref import WeakSet
+
+logger = logging.getLogger(__name__)
+_indexes = WeakSet()
+
+
+def _after_fork():
+    # the watcher thread may hold the lock while the process forks
+    for index in _indexes:
+        index._lock = RLock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _rel(path):
+    path = normpath(path).strip('/')
+    return '' if path == '.' else path
+
+
+class TreeIndex(object):
+    '''
+    In memory index of a folder tree: for each directory, its mtime, files
+    and sub directories. Only directories whose mtime changed are scanned
+    again on ``refresh``.
+    '''
+
+    def __init__(self, root, poll_interval=0):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.generation = 0
+        self._dirs = {}
+        self._lock = RLock()
+        self._watcher = None
+        self._watcher_pid = None
+        _indexes.add(self)
+
+    def _scan_dir(self, rel_dir):
+        path = join(self.root, rel_dir)
+        files, subdirs = set(), set()
+        try:
+            mtime = stat(path).st_mtime_ns
+            with scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        subdirs.add(entry.name)
+                    else:
+                        files.add(entry.name)
+        except OSError:
+            return None
+        return mtime, frozenset(files), frozenset(subdirs)
+
+    def _add_tree(self, rel_dir):
+        todo = [rel_dir]
+        while todo:
+            current = todo.pop()
+            entry = self._scan_dir(current)
+            if entry is None:
+                continue
+            self._dirs[current] = entry
+            todo.extend(join(current, d) for d in entry[2])
+
+    def _drop_tree(self, rel_dir):
+        prefix = rel_dir + '/'
+        for key in list(self._dirs):
+            if key == rel_dir or key.startswith(prefix):
+                del self._dirs[key]
+
+    def build(self):
+        with self._lock:
+            self._dirs = {}
+            self._add_tree('')
+            self.generation += 1
+        return self
+
+    def refresh(self):
+        changed = False
+        with self._lock:
+            for rel_dir in list(self._dirs):
+                old = self._dirs.get(rel_dir)
+                if old is None:
+                    continue
+                try:
+                    mtime = stat(join(self.root, rel_dir)).st_mtime_ns
+                except OSError:
+                    self._drop_tree(rel_dir)
+                    changed = True
+                    continue
+                if mtime == old[0]:
+                    continue
+                changed = True
+                self._rescan(rel_dir, old)
+            if changed:
+                self.generation += 1
+        return changed
+
+    def _rescan(self, rel_dir, old):
+        new = self._scan_dir(rel_dir)
+        if new is None:
+            self._drop_tree(rel_dir)
+            return
+        self._dirs[rel_dir] = new
+        for name in old[2] - new[2]:
+            self._drop_tree(join(rel_dir, name))
+        for name in new[2] - old[2]:
+            self._add_tree(join(rel_dir, name))
+
+    def invalidate(self, path=None):
+        '''
+        Rescan the directory holding ``path`` (relative to the root or
+        absolute), or the whole tree when ``path`` is None.
+        '''
+        if path is None:
+            return self.build()
+        if path.startswith(self.root):
+            path = path[len(self.root):]
+        rel = _rel(path)
+        with self._lock:
+            if rel not in self._dirs:
+                rel = _rel(dirname(rel))
+            while rel and rel not in self._dirs:
+                rel = _rel(dirname(rel))
+            self._rescan(
+                rel, self._dirs.get(rel, (0, frozenset(), frozenset())))
+            self.generation += 1
+        return self
+
+    def dir_count(self):
+        return len(self._dirs)
+
+    def isdir(self, rel_dir):
+        return _rel(rel_dir) in self._dirs
+
+    def has_file(self, rel_path):
+        rel_path = _rel(rel_path)
+        entry = self._dirs.get(_rel(dirname(rel_path)))
+        return entry is not None and basename(rel_path) in entry[1]
+
+    def files(self, rel_dir):
+        entry = self._dirs.get(_rel(rel_dir))
+        return entry[1] if entry else frozenset()
+
+    def find(self, fname):
+        return tuple(
+            join(rel_dir, fname)
+            for rel_dir, entry in list(self._dirs.items())
+            if fname in entry[1])
+
+    def iter_files(self):
+        for rel_dir, entry in list(self._dirs.items()):
+            for fname in entry[1]:
+                yield join(rel_dir, fname)
+
+    def ensure_watcher(self):
+        '''
+        Start the polling thread in the current process, threads don't
+        survive a fork so this is called lazily from lookups.
+        '''
+        if not self.poll_interval or self._watcher_pid == getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == getpid():
+                return
+            self._watcher_pid = getpid()
+            self._watcher = Thread(
+                target=self._watch, name='dynrender-index-%s' % self.root,
+                daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(
+                    'index refresh failed: %s' % self.root, exc_info=e)
+
+
+def get_tree_index(app, root):
+    '''
+    Return the index of ``root`` registered on ``app``, building it on first
+    use.
+    '''
+    indexes = getattr(app, 'tree_indexes', None)
+    if indexes is None:
+        indexes = app.tree_indexes = {}
+    index = indexes.get(root)
+    if index is None:
+        index = indexes[root] = TreeIndex(
+            root, float(app.config.get('DATA_INDEX_POLL', 2) or 0)).build()
+    index.ensure_watcher()
+    return index
+
+
+def invalidate_indexes(app, path=None):
+    '''
+    Rescan the directory holding ``path`` in every index of ``app`` under
+    which it lies, or every index when ``path`` is None. Return the number
+    of indexes rescanned.
+    '''
+    count = 0
+    for root, index in list(getattr(app, 'tree_indexes', {}).items()):
+        if path is not None and os.path.isabs(path) and \
+                not normpath(path).startswith(normpath(root) + os.sep):
+            continue
+        index.invalidate(path)
+        count += 1
+    return count
+
+
+def get_trigger_mtime(path):
+    try:
+        return stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def check_index_trigger(app):
+    '''
+    Rebuild the indexes of ``app`` when the ``DATA_INDEX_TRIGGER`` file was
+    touched since the last check (``flask dynrender invalidate``), this
+    reaches every worker process without a watcher thread.
+    '''
+    mtime = get_trigger_mtime(app.config['DATA_INDEX_TRIGGER'])
+    if mtime == app.index_trigger_mtime:
+        return False
+    app.index_trigger_mtime = mtime
+    invalidate_indexes(app)
+    return True
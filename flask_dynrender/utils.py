@@ -1,3 +1,4 @@
+import os
 import re
 import json
 from os.path import realpath, join
@@ -14,19 +15,25 @@ def redirect_to_static():
 
 
 def _cast_value(value):
-    if not isinstance(value, str):
+    if not isinstance(value, str) or not value:
         return value
+    first = value[0]
     try:
-        if value.isdigit():
-            return int(value)
-        if FLOAT_REG.match(value):
-            return float(value)
-        if value.upper() in TRUE_VALUES:
+        if first.isdigit() or first in '.,':
+            if value.isdigit():
+                return int(value)
+            if FLOAT_REG.match(value):
+                return float(value)
+            return value
+        if first == '{':
+            if value.endswith('}'):
+                return json.loads(value)
+            return value
+        upper = value.upper()
+        if upper in TRUE_VALUES:
             return True
-        if value.upper() in FALSE_VALUES:
+        if upper in FALSE_VALUES:
             return False
-        if value.startswith('{') and value.endswith('}'):
-            return json.loads(value)
     except:
         pass
     return value
@@ -36,3 +43,17 @@ def _get_realpath(path):
     if path.startswith('/'):
         return path
     return realpath(path)
+
+
+def check_private(path):
+    '''
+    Raise ``ValueError`` unless ``path`` belongs to the current user and no
+    one else can write to it: the files found there are trusted.
+    '''
+    if not hasattr(os, 'getuid'):
+        return
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise ValueError(
+            '%s must belong to the current user and not be writable by '
+            'others' % path)
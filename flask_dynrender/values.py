@@ -0,0 +1,125 @@
+import re
+import datetime
+
+date_re = re.compile(
+    r'^Date\((?P<year>\d{4})\,(?P<month>[01]?\d)\,(?P<day>[0-3]?\d)\)$')
+datetime_re = re.compile(
+    r'^Datetime\((?P<year>\d{4})\,(?P<month>[01]?\d)\,(?P<day>[0-3]\d)\,'
+    r'(?P<hour>[0-2]?\d)\,(?P<minute>[0-5]?\d)(\,(?P<second>[0-5]?\d))?\)$')
+
+# returned by a type decoder which doesn't handle the value
+NOT_DECODED = object()
+_MISSING = object()
+# decoded values safe to share between requests through the memo
+IMMUTABLE_TYPES = (
+    type(None), bool, int, float, complex, str, bytes, datetime.date,
+    datetime.time, datetime.timedelta, tuple, frozenset)
+
+
+def _match_cast(_cls, reg):
+    def decode(value):
+        match = reg.match(value)
+        if match is None:
+            return NOT_DECODED
+        return _cls(**{
+            k: int(v) for k, v in match.groupdict().items() if v is not None})
+    return decode
+
+
+def _literal(literal, result):
+    def decode(value):
+        if len(value) == len(literal) and value.lower() == literal:
+            return result
+        return NOT_DECODED
+    return decode
+
+
+def _decode_number(value):
+    if value.isdecimal():
+        return int(value)
+    left, dot, right = value.partition('.')
+    if dot and left.isdecimal() and right.isdecimal():
+        return float(value)
+    return NOT_DECODED
+
+
+def _decode_today(value):
+    return datetime.date.today() if value == 'Date(now)' else NOT_DECODED
+
+
+def _decode_now(value):
+    return datetime.datetime.now() if value == 'Datetime(now)' else \
+        NOT_DECODED
+
+
+class ValueDecoder(object):
+    '''
+    Decode the string values of data files (None, booleans, numbers, dates)
+    in a single pass: the decoders registered for the first character of the
+    value are the only ones tried (those of ``0`` for another digit without
+    its own). Immutable results are memoized, except for the ``volatile``
+    types like ``Date(now)``.
+    '''
+    max_memo_length = 64
+
+    def __init__(self, memo_size=4096):
+        self.memo_size = memo_size
+        self._types = {}
+        self._memo = {}
+
+    def register(self, first_chars, decoder, volatile=False):
+        '''
+        Add ``decoder`` for the values starting with one of ``first_chars``,
+        it returns the decoded value or ``NOT_DECODED``.
+        '''
+        for char in first_chars:
+            self._types.setdefault(char, []).append((decoder, volatile))
+        self._memo.clear()
+
+    def decode(self, value):
+        '''
+        Return ``(decoded, volatile)``, ``decoded`` is ``value`` itself when
+        no decoder handles it.
+        '''
+        strip_v = value.strip()
+        if not strip_v:
+            return value, False
+        first = strip_v[0]
+        decoders = self._types.get(first)
+        if decoders is None and first.isdecimal():
+            decoders = self._types.get('0')
+        if decoders is None:
+            return value, False
+        memo = self._memo
+        result = memo.get(strip_v, _MISSING)
+        if result is not _MISSING:
+            return (value if result is NOT_DECODED else result), False
+        for decoder, volatile in decoders:
+            result = decoder(strip_v)
+            if result is NOT_DECODED:
+                continue
+            if volatile:
+                return result, True
+            break
+        if len(strip_v) <= self.max_memo_length and (
+                result is NOT_DECODED or
+                isinstance(result, IMMUTABLE_TYPES)):
+            if len(memo) >= self.memo_size:
+                memo.clear()
+            memo[strip_v] = result
+        return (value if result is NOT_DECODED else result), False
+
+
+value_decoder = ValueDecoder()
+value_decoder.register('nN', _literal('none', None))
+value_decoder.register('fF', _literal('false', False))
+value_decoder.register('tT', _literal('true', True))
+value_decoder.register('0123456789', _decode_number)
+value_decoder.register('D', _decode_today, volatile=True)
+value_decoder.register('D', _decode_now, volatile=True)
+value_decoder.register('D', _match_cast(datetime.date, date_re))
+value_decoder.register('D', _match_cast(datetime.datetime, datetime_re))
+
+
+def register_value_type(first_chars, decoder, volatile=False):
+    value_decoder.register(first_chars, decoder, volatile)
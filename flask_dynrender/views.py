@@ -1,10 +1,22 @@
+import os
+from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 from os.path import splitext, join, dirname
 from jinja2.exceptions import TemplateNotFound
-from flask import abort, request, g, current_app, render_template, flash
+from flask import (
+    abort, request, g, current_app, render_template, flash, session,
+    make_response, stream_with_context, get_flashed_messages)
 from flask.views import MethodView as FlaskMethodView
-from .context_handlers import JsonContextHandler, IniContextHandler
+from .context_handlers import JsonContextHandler, IniContextHandler, \
+    TomlContextHandler, YamlContextHandler, SqliteContextHandler
+from .context_handlers.base import pop_lazy_dependencies
 from .forms import get_form_class
 from .mail_handler import get_message
+from .cache import context_cache, file_signature
+from .timing import phase, set_target
+from .formatting import request_locale_key
+from .http_cache import template_dependencies, compute_validator, \
+    is_not_modified
 from . import mail
 
 
@@ -18,8 +30,18 @@ class BaseView(FlaskMethodView):
     hidden_prefix = ('.', '_')
     auto_index = True
     ctx_handler_class = None
+    conditional_get = True
+    stream = False
+    stream_buffer = 40
 
     def dispatch_request(self, *args, **kwargs):
+        meth = self.prepare_request(kwargs)
+        return meth() if meth else abort(405)
+
+    def prepare_request(self, kwargs):
+        '''
+        Check the target of the request, return the method handling it.
+        '''
         meth = getattr(self, request.method.lower(), None)
         self.kwargs = kwargs
         self.target = self.clean_target(kwargs.get(self.target_kw, ''))
@@ -27,13 +49,15 @@ class BaseView(FlaskMethodView):
             self.target = 'index.{0}'.format(self.ext_uri)
         if not self.validate_target(self.target):
             abort(404)
+        if not self.route_exists(self.target):
+            abort(404)
+        set_target(self.target)
 
         # If the request method is HEAD and we don't have a handler for it
         # retry with GET.
         if meth is None and request.method == 'HEAD':
             meth = getattr(self, 'get', None)
-
-        return meth() if meth else abort(405)
+        return meth
 
     def validate_target(self, target):
         if any(target.startswith(x) for x in self.hidden_prefix):
@@ -42,6 +66,12 @@ class BaseView(FlaskMethodView):
             return target.endswith(self.ext_uri)
         return target.lower().endswith(self.ext_uri.lower())
 
+    def route_exists(self, target):
+        table = getattr(current_app, 'route_table', None)
+        if table is None:
+            return True
+        return table.get_template_name(target) is not None
+
     def clean_target(self, target):
         if self.auto_index and not target.endswith('.%s' % self.ext_uri):
             return join(target, 'index.{0}'.format(self.ext_uri))
@@ -50,8 +80,14 @@ class BaseView(FlaskMethodView):
     def get_template(self):
         path = '{0}.{1}'.format(splitext(self.target)[0], self.TPL_EXT)
         pattern = join(dirname(self.target), '_pattern_.{0}'.format(self.TPL_EXT))
+        names = [path, pattern]
+        table = getattr(current_app, 'route_table', None)
+        if table is not None:
+            # known from the template index, the loader never sees a miss
+            name = table.get_template_name(self.target)
+            names = [name] if name else []
         try:
-            return current_app.jinja_env.select_template([path, pattern])
+            return current_app.jinja_env.select_template(names)
         except TemplateNotFound as e:
             if current_app.debug:
                 raise e
@@ -67,27 +103,246 @@ class BaseView(FlaskMethodView):
         kwargs.pop('target', None)
         return self.get_ctx_handler_class()(target=self.target, **kwargs)
 
+    def get_context_key(self, ctx_kw):
+        '''
+        Key of the processed context in ``context_cache``, None when the
+        context can't be cached (kwargs holding objects like a posted form).
+        '''
+        if not all(
+            isinstance(v, (str, int, float, bool, type(None)))
+            for v in ctx_kw.values()
+        ):
+            return None
+        return (
+            self.get_ctx_handler_class().__name__, self.target,
+            tuple(sorted(ctx_kw.items())))
+
+    def get_context_data(self, ctx_kw):
+        '''
+        Return the processed ``(global, scope, meta, uri_kwargs)`` of the
+        target, from ``context_cache`` while none of its data files changed.
+        '''
+        key = self.get_context_key(ctx_kw)
+        if key is not None and context_cache.enabled:
+            data = context_cache.get_valid(key)
+            if data is not None:
+                return deepcopy(data)
+        ctx_handler = self.get_ctx_handler(identifier=self.target, **ctx_kw)
+        ctx_handler.process()
+        data = (
+            ctx_handler.get_global(), ctx_handler.get_scope(),
+            ctx_handler.get_meta(), ctx_handler.get_uri_kwargs())
+        if key is not None and not ctx_handler.volatile:
+            context_cache.set_valid(
+                key, ctx_handler.dependencies, deepcopy(data))
+        return data
+
     def get_context(self, **kwargs):
         ctx_kw = self.kwargs.copy()
         ctx_kw.update(kwargs)
-        ctx_handler = self.get_ctx_handler(identifier=self.target, **ctx_kw)
-        ctx_handler.process()
-        for key, value in ctx_handler.get_global().items():
+        global_ctx, ctx, meta, uri_kwargs = self.get_context_data(ctx_kw)
+        for key, value in global_ctx.items():
             setattr(g, key, value)
-        ctx = ctx_handler.get_scope()
-        ctx['META'] = ctx_handler.get_meta()
-        ctx['__kwargs__'] = ctx_handler.get_uri_kwargs()
-        if request.path in current_app.contact_uris:
+        ctx['META'] = meta
+        ctx['__kwargs__'] = uri_kwargs
+        if self.use_contact_form():
             ctx['form'] = self.kwargs.get(
                 'form', get_form_class(current_app)())
         return ctx
 
+    def use_contact_form(self):
+        if request.environ.get('dynrender.no_form'):
+            return False
+        return request.path in current_app.contact_uris
+
+    def get_page_cache(self):
+        '''
+        Page cache backend when the response of this request can be cached:
+        GET without contact form nor pending flashed messages.
+        '''
+        cache = getattr(current_app, 'page_cache', None)
+        if cache is None or request.method not in ('GET', 'HEAD'):
+            return None
+        if self.use_contact_form() or '_flashes' in session:
+            return None
+        return cache
+
+    def get_page_key(self):
+        return (
+            type(self).__name__, self.target, request.host,
+            request.query_string, request_locale_key())
+
+    def get_cached_page(self):
+        '''
+        Response from the page cache (in the negotiated encoding when
+        stored), None when the page is not cached.
+        '''
+        cache = self.get_page_cache()
+        if cache is None:
+            return None
+        compressor = self.get_compressor()
+        encoding = compressor.negotiate() if compressor else None
+        key = self.get_page_key()
+        if encoding:
+            body = cache.get(key + (encoding,))
+            if body is not None:
+                return compressor.response(body, encoding)
+        body = cache.get(key)
+        if body is not None:
+            return self.page_response(body)
+        return None
+
     def render(self):
-        ctx = self.get_context()
-        return render_template(self.get_template(), __scope__=ctx, **ctx)
+        cached = self.get_cached_page()
+        if cached is not None:
+            return cached
+        cache = self.get_page_cache()
+        compressor = self.get_compressor()
+        encoding = compressor.negotiate() if compressor else None
+        if cache is not None:
+            key = self.get_page_key()
+        # an unknown target is answered 404 before its context is cached
+        with phase('get_template'):
+            template = self.get_template()
+        with phase('context'):
+            ctx = self.get_context()
+        if self.use_stream(ctx):
+            return self.stream_template(template, ctx)
+        with phase('render'):
+            body = render_template(template, __scope__=ctx, **ctx)
+        self.merge_lazy_dependencies()
+        if cache is not None:
+            deps = self.get_dependencies()
+            if deps is not None:
+                body = body.encode('utf-8')
+                cache.set(key, deps, body)
+                # compressed once, served from the cache afterwards
+                variants = compressor.variants(body) if compressor else {}
+                for name, data in variants.items():
+                    cache.set(key + (name,), deps, data)
+                if encoding in variants:
+                    return compressor.response(variants[encoding], encoding)
+                return self.page_response(body)
+        if encoding:
+            data = compressor.compress(
+                body.encode('utf-8'), encoding, compressor.dynamic_level)
+            if data is not None:
+                return compressor.response(data, encoding)
+        return self.page_response(body)
+
+    def merge_lazy_dependencies(self):
+        '''
+        Bind the cached context to the files read by the lazy values resolved
+        while rendering, drop it when one of them is volatile.
+        '''
+        deps, volatile = pop_lazy_dependencies()
+        key = self.get_context_key(self.kwargs)
+        if key is None or not (deps or volatile):
+            return
+        if volatile:
+            context_cache.pop(key)
+        else:
+            context_cache.add_dependencies(key, deps)
+
+    def get_compressor(self):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        return getattr(current_app, 'compressor', None)
+
+    def page_response(self, body):
+        compressor = self.get_compressor()
+        if compressor is None:
+            return body
+        return compressor.response(body, None)
+
+    def use_conditional_get(self):
+        conditional = current_app.config.get(
+            'CONDITIONAL_GET', self.conditional_get)
+        if not conditional:
+            return False
+        return not self.use_contact_form() and '_flashes' not in session
+
+    def use_stream(self, ctx):
+        '''
+        Stream the page when the view class or the ``stream`` META of the
+        target asks for it.
+        '''
+        return bool(ctx.get('META', {}).get('stream', self.stream))
+
+    def stream_template(self, template, ctx):
+        app = current_app._get_current_object()
+        # flashed messages are popped from the session now, it is saved
+        # before the body is sent
+        get_flashed_messages()
+        context = dict(ctx, __scope__=ctx)
+        app.update_template_context(context)
+        stream = template.stream(context)
+        stream.enable_buffering(self.stream_buffer)
+
+        def generate():
+            yield from stream
+            self.merge_lazy_dependencies()
+        return app.response_class(
+            stream_with_context(generate()), mimetype='text/html')
+
+    def get_validator(self):
+        '''
+        Return ``(etag, last_modified)`` of the target from its template
+        chain and the data files of its last processed context, None when
+        unknown (context not processed yet or not cacheable).
+        '''
+        deps = self.get_dependencies()
+        if deps is None:
+            return None
+        deps = {path: file_signature(path) for path in deps}
+        key = self.get_context_key(self.kwargs)
+        locale = request_locale_key()
+        if locale is not None:
+            key = (key, locale)
+        return compute_validator(key, deps)
+
+    def get_dependencies(self):
+        '''
+        Return ``{path: signature}`` of the template chain, of the data
+        files recorded by the last processed context of the target and of
+        the static manifest, None when unknown.
+        '''
+        key = self.get_context_key(self.kwargs)
+        data_deps = context_cache.get_dependencies(key) if key else None
+        if data_deps is None:
+            return None
+        tpl_deps = template_dependencies(
+            current_app.jinja_env, self.get_template().name)
+        if tpl_deps is None:
+            return None
+        deps = dict(data_deps)
+        deps.update(tpl_deps)
+        # pages link the hashed static files of the manifest
+        manifest = getattr(current_app, 'asset_manifest', None)
+        if manifest is not None:
+            deps[manifest.path] = file_signature(manifest.path)
+        return deps
 
     def get(self):
-        return self.render()
+        if not self.use_conditional_get():
+            return self.render()
+        compressor = self.get_compressor()
+        # the compressed variants share a weak validator, the 304 too
+        weak = compressor is not None and compressor.negotiate() is not None
+        validator = self.get_validator()
+        if validator and is_not_modified(request, *validator):
+            resp = current_app.response_class(status=304)
+        else:
+            resp = make_response(self.render())
+            # rendering may have added the files of lazy values
+            validator = self.get_validator()
+        if compressor is not None:
+            resp.vary.add('Accept-Encoding')
+        if validator:
+            resp.set_etag(validator[0], weak=weak)
+            if validator[1]:
+                resp.last_modified = validator[1]
+        return resp
 
     def post(self):
         if not current_app.config_parser.has_section('contact'):
@@ -98,16 +353,93 @@ class BaseView(FlaskMethodView):
         self.kwargs['form'] = form
         if form.validate():
             mess = get_message(form)
-            mail.send(mess)
+            queue = getattr(current_app, 'mail_queue', None)
+            if queue is None or not queue.put(mess) and not queue.spool_dir:
+                # a full queue without spool would drop the message
+                mail.send(mess)
             flash_mess = current_app.config.get('mail', {}).get('FLASH')
             if flash_mess:
                 flash(flash_mess)
         return self.render()
 
 
+def get_load_executor(app):
+    '''
+    Thread pool of the async views (``ASYNC_LOAD_WORKERS`` threads), one per
+    worker process.
+    '''
+    executor, pid = getattr(app, 'load_executor', (None, None))
+    if pid != os.getpid():
+        executor = ThreadPoolExecutor(
+            int(app.config.get('ASYNC_LOAD_WORKERS', 8)),
+            thread_name_prefix='dynrender-load')
+        app.load_executor = (executor, os.getpid())
+    return executor
+
+
+class AsyncViewMixin(object):
+    '''
+    Async ``dispatch_request`` (``flask[async]`` or an ASGI server): the
+    data files of the target are read and parsed concurrently on a thread
+    pool, then the context is processed in the usual merge order.
+    '''
+    cached_page = None
+
+    async def dispatch_request(self, *args, **kwargs):
+        meth = self.prepare_request(kwargs)
+        if meth is None:
+            abort(405)
+        await self.prefetch_context()
+        return meth()
+
+    async def prefetch_context(self):
+        if request.method in ('GET', 'HEAD'):
+            # answered without the data files
+            if self.use_conditional_get():
+                validator = self.get_validator()
+                if validator and is_not_modified(request, *validator):
+                    return 0
+            self.cached_page = self.get_cached_page()
+            if self.cached_page is not None:
+                return 0
+        key = self.get_context_key(self.kwargs)
+        if key is not None and context_cache.enabled and \
+                context_cache.get_valid(key) is not None:
+            return 0
+        ctx_handler = self.get_ctx_handler(
+            identifier=self.target, **self.kwargs)
+        with phase('prefetch'):
+            return await ctx_handler.prefetch(
+                get_load_executor(current_app._get_current_object()))
+
+    def get_cached_page(self):
+        cached, self.cached_page = self.cached_page, None
+        return cached if cached is not None else super().get_cached_page()
+
+
 class JsonJinjaHtmlView(BaseView):
     ctx_handler_class = JsonContextHandler
 
 
 class IniJinjaHtmlView(BaseView):
     ctx_handler_class = IniContextHandler
+
+
+class TomlJinjaHtmlView(BaseView):
+    ctx_handler_class = TomlContextHandler
+
+
+class YamlJinjaHtmlView(BaseView):
+    ctx_handler_class = YamlContextHandler
+
+
+class SqliteJinjaHtmlView(BaseView):
+    ctx_handler_class = SqliteContextHandler
+
+
+class AsyncJsonJinjaHtmlView(AsyncViewMixin, BaseView):
+    ctx_handler_class = JsonContextHandler
+
+
+class AsyncIniJinjaHtmlView(AsyncViewMixin, BaseView):
+    ctx_handler_class = IniContextHandler
@@ -7,7 +7,7 @@ setup(
 
     # la version du code
     version='0.0.0',
-    packages=find_packages(),
+    packages=find_packages(exclude=('benchmarks', 'benchmarks.*')),
     author="THIVOLLE-CAZAT Cédric",
     description="Flask project to render static jinja files with context",
     # long_description=open('README.md').read(),
@@ -25,9 +25,13 @@ setup(
         'PyYAML',
         'validate-email'
     ],
+    extras_require={
+        'async': ['Flask[async]'],
+    },
     entry_points={
         'flask.commands': [
             'assets = flask_assets:assets',
+            'dynrender = flask_dynrender.cli:dynrender',
         ],
     },
     license="MIT",
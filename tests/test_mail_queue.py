@@ -0,0 +1,172 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import socketserver
+import unittest
+from unittest import mock
+from flask import Flask
+from flask_mail import Mail, Message
+from flask_dynrender.mail_queue import MailQueue
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    '''
+    Just enough SMTP to let smtplib deliver a message.
+    '''
+
+    def reply(self, line):
+        self.wfile.write(('%s\r\n' % line).encode())
+
+    def handle(self):
+        self.reply('220 stub')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode().strip().upper()
+            if cmd.startswith(('EHLO', 'HELO')):
+                self.reply('250 stub')
+            elif cmd == 'DATA':
+                self.reply('354 end with .')
+                lines = []
+                for data in iter(self.rfile.readline, b''):
+                    if data == b'.\r\n':
+                        break
+                    lines.append(data)
+                self.server.messages.append(b''.join(lines))
+                self.reply('250 queued')
+            elif cmd == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubSMTPHandler)
+        self.messages = []
+
+
+class MailQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubSMTPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.spool = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config.update(
+            MAIL_SERVER='127.0.0.1', MAIL_PORT=self.server.server_address[1],
+            MAIL_DEFAULT_SENDER='site@example.com')
+        self.mail = Mail(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.spool)
+
+    def get_queue(self, **kwargs):
+        kwargs.setdefault('spool_dir', self.spool)
+        kwargs.setdefault('retry_delay', 0.01)
+        return MailQueue(self.app, self.mail, **kwargs)
+
+    def message(self, i):
+        return Message(
+            subject='message %s' % i, recipients=['to@example.com'],
+            body='body %s' % i)
+
+    def wait_sent(self, queue, count, timeout=10):
+        deadline = time.monotonic() + timeout
+        while queue.sent + queue.failed < count:
+            if time.monotonic() > deadline:
+                self.fail('%s of %s messages sent' % (queue.sent, count))
+            time.sleep(0.01)
+
+    def subjects(self):
+        return sorted(
+            line.split(b':', 1)[1].strip().decode()
+            for msg in self.server.messages for line in msg.splitlines()
+            if line.startswith(b'Subject:'))
+
+    def test_delivery(self):
+        queue = self.get_queue()
+        for i in range(10):
+            self.assertTrue(queue.put(self.message(i)))
+        queue.join()
+        self.assertEqual(
+            self.subjects(), sorted('message %s' % i for i in range(10)))
+        self.assertEqual(queue.stats()['sent'], 10)
+        self.assertEqual(os.listdir(self.spool), [])
+
+    def test_recover_does_not_claim_queued_messages(self):
+        queue = self.get_queue(workers=4)
+        stop = threading.Event()
+
+        def recover():
+            while not stop.is_set():
+                queue.recover()
+
+        thread = threading.Thread(target=recover)
+        thread.start()
+        try:
+            for i in range(50):
+                queue.put(self.message(i))
+            self.wait_sent(queue, 50)
+        finally:
+            stop.set()
+            thread.join()
+        queue.join()
+        self.assertEqual(
+            self.subjects(), sorted('message %s' % i for i in range(50)))
+
+    def test_recover_dead_process_spool(self):
+        queue = self.get_queue(workers=0)
+        queue.put(self.message(0))
+        name = os.listdir(self.spool)[0]
+        # left by a process that does not exist anymore
+        dead = name.replace('.%s.mail' % os.getpid(), '.999999999.mail')
+        os.rename(os.path.join(self.spool, name), os.path.join(
+            self.spool, dead))
+        queue = self.get_queue()
+        queue.start()
+        queue.join()
+        self.assertEqual(self.subjects(), ['message 0'])
+        self.assertEqual(os.listdir(self.spool), [])
+
+    def test_worker_survives_spool_errors(self):
+        queue = self.get_queue(workers=1)
+        with mock.patch('flask_dynrender.mail_queue.os.unlink',
+                        side_effect=OSError('read only')):
+            queue.put(self.message(0))
+            queue.join()
+        queue.put(self.message(1))
+        queue.join()
+        self.assertEqual(self.subjects(), ['message 0', 'message 1'])
+
+    def test_failed_delivery_is_kept(self):
+        self.app.config['MAIL_PORT'] = 1
+        self.mail = Mail(self.app)
+        queue = self.get_queue(retries=1)
+        queue.put(self.message(0))
+        queue.join()
+        self.assertEqual(queue.stats()['failed'], 1)
+        self.assertEqual(queue.stats()['retried'], 1)
+        self.assertTrue(os.listdir(self.spool)[0].endswith('.failed'))
+
+    def test_full_queue(self):
+        queue = self.get_queue(workers=0, maxsize=1, spool_dir=None)
+        self.assertTrue(queue.put(self.message(0)))
+        self.assertFalse(queue.put(self.message(1)))
+        self.assertEqual(queue.stats()['rejected'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()